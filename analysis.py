@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Monte Carlo analysis of a timetable: runs many seeded full-day sessions of
+# the move logic across a pool of processes and reports how full each siding
+# gets, how often it overflows, how long wagons wait in the sidings before
+# leaving and how full the departing rakes are. Each session's seed comes
+# from the one given, so a report can be repeated whatever the number of
+# processes, e.g.
+#
+#   ./analysis.py lion-mills -n 10000 -s 1
+
+import time, json, random, argparse, itertools, collections
+import multiprocessing
+from simulation import Simulation, SessionTotals, runSession
+
+
+CHUNK_SIZE = 50
+BAR_WIDTH = 40
+
+template = None
+
+def initWorker( baseName, seed, useState ):
+    # the seed also places the initial wagons, which must be the same in
+    # every process
+    global template
+    template = Simulation( baseName, seed, useState )
+
+class Results( SessionTotals ):
+    def __init__( self, sidings ):
+        SessionTotals.__init__( self, sidings )
+        self.occupancy = [ collections.Counter() for idx in range( sidings ) ]
+        self.overflowSessions = [ 0 ] * sidings
+        self.dwell = collections.Counter()
+        self.departures = 0
+        self.departedWagons = 0
+        self.neverOutgoing = 0
+
+    def beforeMove( self, sim ):
+        if sim.moves.moveType( sim.moveIndex ) == '-':
+            # the outgoing wagons join whatever is in the rake, and their
+            # ages are reset as they leave so are taken first
+            self.departures = self.departures + 1
+            self.departedWagons = self.departedWagons \
+                                  + len( sim.rakes[ sim.nextRake ] )
+            for siding in sim.sidings:
+                wagons = siding.wagons
+                ages = list(
+                    itertools.compress( wagons.ages, wagons.outgoing ) )
+                self.dwell.update( ages )
+                self.departedWagons = self.departedWagons + len( ages )
+
+    def afterMove( self, sim ):
+        SessionTotals.afterMove( self, sim )
+        for idx in range( len( sim.sidings ) ):
+            counts = self.occupancy[ idx ]
+            occupied = len( sim.sidings[ idx ].wagons )
+            counts[ occupied ] = counts[ occupied ] + 1
+
+    def endSession( self, sim ):
+        SessionTotals.endSession( self, sim )
+        for idx in range( len( sim.sidings ) ):
+            if sim.sidings[ idx ].overflows > 0:
+                self.overflowSessions[ idx ] = \
+                    self.overflowSessions[ idx ] + 1
+        for siding in sim.sidings:
+            self.neverOutgoing = self.neverOutgoing \
+                                 + siding.wagons.outgoing.count( 0 )
+
+    def add( self, other ):
+        SessionTotals.add( self, other )
+        for idx in range( len( self.occupancy ) ):
+            self.occupancy[ idx ].update( other.occupancy[ idx ] )
+            self.overflowSessions[ idx ] = self.overflowSessions[ idx ] \
+                                           + other.overflowSessions[ idx ]
+        self.dwell.update( other.dwell )
+        self.departures = self.departures + other.departures
+        self.departedWagons = self.departedWagons + other.departedWagons
+        self.neverOutgoing = self.neverOutgoing + other.neverOutgoing
+
+def runChunk( seeds ):
+    results = Results( len( template.sidings ) )
+    for seed in seeds:
+        runSession( template.copy( seed ), results )
+    return results
+
+def analyse( baseName, sessions, seed=None, processes=None, useState=False ):
+    seeds = random.Random( seed )
+    seeds = [ seeds.getrandbits( 32 ) for idx in xrange( sessions ) ]
+    chunks = [  seeds[ idx:idx + CHUNK_SIZE ]
+                for idx in xrange( 0, sessions, CHUNK_SIZE ) ]
+    pool = multiprocessing.Pool(
+                processes,
+                initWorker,
+                ( baseName, seed, useState ) )
+    try:
+        initWorker( baseName, seed, useState )
+        results = Results( len( template.sidings ) )
+        for chunk in pool.imap_unordered( runChunk, chunks ):
+            results.add( chunk )
+    finally:
+        pool.close()
+        pool.join()
+    return ( template, results )
+
+def percentile( counts, p ):
+    # the value p percent of the way through a histogram
+    total = sum( counts.values() )
+    seen = 0
+    for value in sorted( counts ):
+        seen = seen + counts[ value ]
+        if seen * 100 >= total * p:
+            return value
+    return None
+
+def mean( counts ):
+    total = sum( counts.values() )
+    if total == 0:
+        return 0
+    return float( sum( [ value * count
+                         for (value,count) in counts.items() ] ) ) / total
+
+def report( sim, results, elapsed, processes ):
+    sessions = max( results.sessions, 1 )
+    print( "{} sessions of {} moves in {:.2f}s on {} processes".format(
+        results.sessions, len( sim.moves ), elapsed, processes ) )
+    for idx in range( len( sim.sidings ) ):
+        siding = sim.sidings[ idx ]
+        occupancy = results.occupancy[ idx ]
+        print( "" )
+        print( "siding {}: length {}, mean occupancy {:.2f}, "
+               "overflowed in {:.1f}% of sessions, "
+               "{:.2f} wagons a session".format(
+                    idx,
+                    siding.length,
+                    mean( occupancy ),
+                    100.0 * results.overflowSessions[ idx ] / sessions,
+                    float( results.overflows[ idx ] ) / sessions ) )
+        total = max( sum( occupancy.values() ), 1 )
+        for wagons in range( max( occupancy.keys() or [ 0 ] ) + 1 ):
+            share = float( occupancy[ wagons ] ) / total
+            print( "  {:>3} {:6.1f}% {}".format(
+                wagons,
+                share * 100,
+                '#' * int( round( share * BAR_WIDTH ) ) ) )
+    print( "" )
+    if len( results.dwell ) > 0:
+        print( "age at departure: median {}, 90% {}, max {}".format(
+            percentile( results.dwell, 50 ),
+            percentile( results.dwell, 90 ),
+            max( results.dwell ) ) )
+    departures = max( results.departures, 1 )
+    print( "rakes: {:.1f} wagons a departure, {:.1f}% of train length, "
+           "{:.1f}% left empty".format(
+                float( results.departedWagons ) / departures,
+                100.0 * results.departedWagons
+                / ( departures * sim.trainLength ),
+                100.0 * results.starvedRakes / departures ) )
+    print( "wagons not chosen to leave at the end of a day: {:.2f}".format(
+        float( results.neverOutgoing ) / sessions ) )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Analyse a timetable over many random sessions' )
+    parser.add_argument( 'baseName' )
+    parser.add_argument( '-n', '--sessions', type=int, default=1000 )
+    parser.add_argument( '-s', '--seed', type=int, default=None )
+    parser.add_argument( '-j', '--processes', type=int, default=None,
+        help='worker processes, default one per CPU' )
+    parser.add_argument( '--use-state', action='store_true',
+        help='start each session from the saved state, not the config' )
+    parser.add_argument( '--json', metavar='FILE',
+        help='also write the histograms to FILE as JSON' )
+    args = parser.parse_args()
+
+    start = time.time()
+    (sim,results) = analyse(
+                        args.baseName,
+                        args.sessions,
+                        args.seed,
+                        args.processes,
+                        args.use_state )
+    report( sim,
+            results,
+            time.time() - start,
+            args.processes or multiprocessing.cpu_count() )
+
+    if args.json != None:
+        f = open( args.json, "w" )
+        json.dump( {    'sessions': results.sessions,
+                        'occupancy': [  dict( occupancy )
+                                        for occupancy in results.occupancy ],
+                        'overflowSessions': results.overflowSessions,
+                        'overflows': results.overflows,
+                        'ageAtDeparture': dict( results.dwell ),
+                        'departures': results.departures,
+                        'departedWagons': results.departedWagons,
+                        'starvedRakes': results.starvedRakes,
+                        'neverOutgoing': results.neverOutgoing },
+                   f,
+                   indent=2,
+                   sort_keys=True )
+        f.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+# Benchmarks for the drawing, move handling, loading and saving paths, run
+# against generated layouts of increasing size. Drawing uses SDL's dummy
+# video driver and the GPIO pins are replaced by a stub module, so this runs
+# anywhere pygame does. Each size runs in its own process so that the peak
+# memory reported is its own, and the results are written as JSON to
+# compare between commits, e.g.
+#
+#   ./benchmark.py -o before.json
+#   ./benchmark.py -o after.json
+
+import os, sys, json, time, math, types, random, resource, shutil
+import subprocess, tempfile, argparse
+
+os.environ.setdefault( 'SDL_VIDEODRIVER', 'dummy' )
+os.environ.setdefault( 'PYGAME_HIDE_SUPPORT_PROMPT', '1' )
+
+SIZES = [ ( 5, 10 ), ( 20, 100 ), ( 50, 500 ), ( 200, 2000 ), ( 500, 5000 ) ]
+SCREEN_SIZE = ( 800, 480 )
+WAGON_TYPES = 8
+MOVES = 40
+FRAMES = 20
+
+def installStubGPIO():
+    gpio = types.ModuleType( 'RPi.GPIO' )
+    gpio.BOARD = gpio.IN = gpio.PUD_DOWN = gpio.RISING = 0
+    gpio.setmode = gpio.setup = gpio.add_event_detect = gpio.cleanup = \
+        lambda *args, **kwargs: None
+    gpio.input = lambda pin: 0
+    gpio.event_detected = lambda pin: False
+    rpi = types.ModuleType( 'RPi' )
+    rpi.GPIO = gpio
+    sys.modules[ 'RPi' ] = rpi
+    sys.modules[ 'RPi.GPIO' ] = gpio
+
+def generate( baseName, sidings, wagons, seed ):
+    rng = random.Random( seed )
+    # room for half as many wagons again as there are
+    length = int( math.ceil( wagons * 1.5 / sidings ) ) + 1
+    trainLength = max( 4, wagons / 20 )
+
+    f = open( baseName + ".layout", "w" )
+    for idx in range( sidings ):
+        types = rng.sample( range( WAGON_TYPES ), 3 )
+        top = 20 + ( idx * 30 ) % 200
+        left = 10 + ( idx / 7 ) % 5 * 10
+        f.write( "{}/{}/{},{};{},{}\n".format(
+            length,
+            ",".join( map( str, types ) ),
+            left, top,
+            left + 350, top ) )
+    f.close()
+
+    def wagonList( count ):
+        return "/".join( [  str( rng.randrange( WAGON_TYPES ) )
+                            for idx in range( count ) ] )
+
+    f = open( baseName + ".config", "w" )
+    f.write( "n/{}\n".format( trainLength ) )
+    f.write( "w/" + "/".join( [ "Type {} wagon,{}".format(
+                                    idx, rng.choice( [ 1, 1.5, 2 ] ) )
+                                for idx in range( WAGON_TYPES ) ] ) + "\n" )
+    for idx in range( 4 ):
+        f.write( "r/" + wagonList( trainLength ) + "\n" )
+    remaining = wagons
+    while remaining > 0:
+        count = min( remaining, 40 )
+        f.write( "i/" + wagonList( count ) + "\n" )
+        remaining = remaining - count
+    f.close()
+
+    f = open( baseName + ".wtt", "w" )
+    for idx in range( MOVES ):
+        f.write( "{}/{}:{:02}/{}/{} goods {}\n".format(
+            '+-'[ idx % 2 ],
+            idx / 4 % 12 + 1,
+            idx * 7 % 60,
+            [ 'am', 'pm' ][ idx / 24 % 2 ],
+            [ 'Arrival of', 'Departure of' ][ idx % 2 ],
+            idx / 2 ) )
+    f.close()
+
+def timed( function, *args ):
+    start = time.time()
+    function( *args )
+    return time.time() - start
+
+def runCase( sidings, wagons, seed ):
+    installStubGPIO()
+    import pygame
+    import simulation, statefile, stationmaster
+
+    directory = tempfile.mkdtemp( prefix='stationmaster-bench-' )
+    try:
+        baseName = os.path.join( directory, "bench" )
+        generate( baseName, sidings, wagons, seed )
+        result = { 'sidings': sidings, 'wagons': wagons }
+
+        start = time.time()
+        sim = simulation.Simulation( baseName, seed )
+        result[ 'load_config_s' ] = time.time() - start
+
+        moveTimes = [   timed( sim.handleNextMoveButton )
+                        for idx in range( len( sim.moves ) ) ]
+        result[ 'move_s' ] = sum( moveTimes ) / len( moveTimes )
+        result[ 'move_max_s' ] = max( moveTimes )
+
+        stored = sum( [ len( siding.wagons ) for siding in sim.sidings ] ) \
+                 + sum( map( len, sim.rakes ) )
+        result[ 'save_s' ] = timed( sim.saveState )
+        result[ 'save_wagons_per_s' ] = stored / max( result[ 'save_s' ], 1e-9 )
+        result[ 'load_state_s' ] = timed( simulation.Simulation, baseName )
+        result[ 'load_wagons_per_s' ] = \
+            stored / max( result[ 'load_state_s' ], 1e-9 )
+
+        state = statefile.readState( baseName + ".state" )
+        f = open( baseName + ".state", "wb" )
+        statefile.writeBinaryState( state, f )
+        f.close()
+        result[ 'load_binary_state_s' ] = \
+            timed( simulation.Simulation, baseName )
+
+        pygame.init()
+        surface = pygame.display.set_mode( SCREEN_SIZE, 0, 32 )
+        game = stationmaster.Game( baseName, surface )
+        # journalling would time the disk rather than the drawing
+        game.closeJournal()
+        game.start()
+        game.drawBoard()
+
+        def fullFrame():
+            game.invalidate( 'all' )
+            game.drawBoard()
+
+        def moveFrame():
+            game.selection = ()
+            game.handleNextMoveButton()
+            game.drawBoard()
+
+        def clockFrame():
+            game.time = game.time + 1
+            game.invalidate( 'clock' )
+            game.drawBoard()
+
+        for (name,frame) in [   ( 'frame_full_s', fullFrame ),
+                                ( 'frame_move_s', moveFrame ),
+                                ( 'frame_clock_s', clockFrame ),
+                                ( 'frame_idle_s', game.drawBoard ) ]:
+            frameTimes = [ timed( frame ) for idx in range( FRAMES ) ]
+            result[ name ] = sum( frameTimes ) / len( frameTimes )
+
+        pygame.quit()
+        result[ 'peak_rss_kb' ] = \
+            resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+        return result
+    finally:
+        shutil.rmtree( directory )
+
+def revision():
+    try:
+        return subprocess.check_output(
+            [ 'git', 'rev-parse', '--short', 'HEAD' ],
+            cwd=os.path.dirname( os.path.abspath( __file__ ) ) ).strip()
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark stationmaster on generated layouts' )
+    parser.add_argument( '-o', '--output',
+        help='file to write the JSON results to, default stdout' )
+    parser.add_argument( '-s', '--seed', type=int, default=1 )
+    parser.add_argument( '--size', nargs=2, type=int, action='append',
+        metavar=( 'SIDINGS', 'WAGONS' ),
+        help='layout size to run, may be repeated' )
+    parser.add_argument( '--case', nargs=2, type=int, help=argparse.SUPPRESS )
+    args = parser.parse_args()
+
+    if args.case != None:
+        json.dump( runCase( args.case[0], args.case[1], args.seed ),
+                   sys.stdout )
+        return
+
+    results = []
+    for (sidings,wagons) in args.size or SIZES:
+        output = subprocess.check_output( [
+            sys.executable,
+            os.path.abspath( __file__ ),
+            '--seed', str( args.seed ),
+            '--case', str( sidings ), str( wagons ) ] )
+        results.append( json.loads( output ) )
+        sys.stderr.write( "{} sidings, {} wagons: {:.2f} ms/move, "
+                          "{:.2f} ms/full frame\n".format(
+                            sidings,
+                            wagons,
+                            results[-1][ 'move_s' ] * 1000,
+                            results[-1][ 'frame_full_s' ] * 1000 ) )
+
+    report = {  'revision': revision(),
+                'python': sys.version.split()[0],
+                'seed': args.seed,
+                'results': results }
+    if args.output != None:
+        f = open( args.output, "w" )
+        json.dump( report, f, indent=2, sort_keys=True )
+        f.close()
+    else:
+        json.dump( report, sys.stdout, indent=2, sort_keys=True )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Output of the board straight to a Linux framebuffer device, for a headless
+# Pi with no X or KMS. The board is drawn off-screen on a surface in the
+# framebuffer's own pixel format, so pixels are converted as they are drawn
+# and never again, and only the rows of each damaged rectangle are copied
+# into the memory-mapped device.
+#
+# Any other file can stand in for the device, e.g. for testing, in which case
+# it is treated as a framebuffer of the size and depth given, and is created
+# if it does not exist.
+
+import os, mmap, errno, fcntl, struct
+import pygame
+
+
+FBIOGET_VSCREENINFO = 0x4600
+FBIOGET_FSCREENINFO = 0x4602
+
+# the start of struct fb_var_screeninfo: resolution, virtual resolution,
+# offset, depth and greyscale flag, then the offset, length and msb_right of
+# the red, green, blue and transparency bit fields
+VAR_SCREENINFO = struct.Struct( '=8I12I' )
+VAR_SCREENINFO_SIZE = 160
+
+# the start of struct fb_fix_screeninfo, up to the bytes per line
+FIX_SCREENINFO = struct.Struct( '@16sLIIIIHHHI' )
+FIX_SCREENINFO_SIZE = 128
+
+DEFAULT_SIZE = ( 800, 480 )
+DEFAULT_DEPTH = 16
+
+# the masks of the RGB565 and XRGB8888 formats a plain file is given
+DEFAULT_MASKS = {   16: ( 0xf800, 0x07e0, 0x001f, 0 ),
+                    32: ( 0xff0000, 0x00ff00, 0x0000ff, 0 ) }
+
+class FramebufferOutput:
+    def __init__( self, deviceName, size=None, depth=DEFAULT_DEPTH ):
+        try:
+            self.f = open( deviceName, "r+b" )
+        except IOError as e:
+            # a missing device is an error, not a file to create in /dev
+            if e.errno != errno.ENOENT or isDevicePath( deviceName ):
+                raise
+            self.f = open( deviceName, "w+b" )
+        try:
+            info = self.screenInfo()
+        except IOError:
+            info = None
+        if info != None:
+            # a real device, which sets the size and format
+            ( xres, yres, xvirt, yvirt, xoffset, yoffset, depth, grey,
+              redOffset, redLength, redRight,
+              greenOffset, greenLength, greenRight,
+              blueOffset, blueLength, blueRight,
+              alphaOffset, alphaLength, alphaRight,
+              self.pitch, length ) = info
+            self.size = ( xres, yres )
+            self.masks = (  fieldMask( redOffset, redLength ),
+                            fieldMask( greenOffset, greenLength ),
+                            fieldMask( blueOffset, blueLength ),
+                            0 )
+            self.offset = yoffset * self.pitch + xoffset * depth / 8
+        else:
+            # a plain file, made big enough for one frame
+            if size == None:
+                size = DEFAULT_SIZE
+            if depth not in DEFAULT_MASKS:
+                raise ValueError(
+                    "{} is not a framebuffer, and a file can only stand in "
+                    "for a 16 or 32 bit one".format( deviceName ) )
+            self.size = tuple( size )
+            self.masks = DEFAULT_MASKS[ depth ]
+            self.pitch = self.size[0] * depth / 8
+            self.offset = 0
+            length = self.pitch * self.size[1]
+            if os.fstat( self.f.fileno() ).st_size < length:
+                self.f.truncate( length )
+        self.depth = depth
+        if size != None:
+            # a smaller board is drawn in the top left of the screen
+            self.size = (   min( size[0], self.size[0] ),
+                            min( size[1], self.size[1] ) )
+        self.map = mmap.mmap( self.f.fileno(), length )
+
+    def screenInfo( self ):
+        # the geometry and format of the device, or an IOError if the file
+        # is not a framebuffer
+        data = fcntl.ioctl(
+                    self.f.fileno(),
+                    FBIOGET_VSCREENINFO,
+                    '\0' * VAR_SCREENINFO_SIZE )
+        info = VAR_SCREENINFO.unpack( data[:VAR_SCREENINFO.size] )
+        data = fcntl.ioctl(
+                    self.f.fileno(),
+                    FBIOGET_FSCREENINFO,
+                    '\0' * FIX_SCREENINFO_SIZE )
+        fields = FIX_SCREENINFO.unpack( data[:FIX_SCREENINFO.size] )
+        # the bytes per line and the length of the framebuffer memory
+        return info + ( fields[-1], fields[2] )
+
+    def createSurface( self ):
+        # the surface to draw the board on
+        return pygame.Surface( self.size, 0, self.depth, self.masks )
+
+    def update( self, surface, damage ):
+        pitch = surface.get_pitch()
+        bytesPerPixel = surface.get_bytesize()
+        bounds = pygame.Rect( ( 0, 0 ), self.size )
+        # the view keeps the surface locked, so it is only held while copying
+        view = surface.get_view( '0' )
+        try:
+            for rect in damage:
+                rect = bounds.clip( rect )
+                if rect.width == surface.get_width() and pitch == self.pitch:
+                    # whole rows are one block in both
+                    self.copy(  view,
+                                rect.top * pitch,
+                                rect.top * self.pitch,
+                                rect.height * pitch )
+                else:
+                    for row in xrange( rect.top, rect.bottom ):
+                        self.copy(  view,
+                                    row * pitch + rect.left * bytesPerPixel,
+                                    row * self.pitch
+                                    + rect.left * bytesPerPixel,
+                                    rect.width * bytesPerPixel )
+        finally:
+            del view
+
+    def copy( self, view, start, destination, length ):
+        # buffer slices the surface's pixels without copying them
+        self.map.seek( self.offset + destination )
+        self.map.write( buffer( view, start, length ) )
+
+    def close( self ):
+        self.map.close()
+        self.f.close()
+
+def isDevicePath( fileName ):
+    return os.path.dirname( os.path.abspath( fileName ) ) == "/dev"
+
+def fieldMask( offset, length ):
+    return ( ( 1 << length ) - 1 ) << offset
@@ -0,0 +1,147 @@
+# Opt-in timing of the main loop. Each pass of the loop is a frame, and the
+# time spent in each phase of it is added up and kept over a rolling window
+# of frames, from which the percentiles for the overlay and the log are
+# taken. Methods are timed by wrapping them on the instance, so when
+# profiling is off nothing is wrapped and the loop only pays for a few calls
+# to the empty methods of NullProfiler.
+
+import time, collections, logging, logging.handlers
+
+
+WINDOW = 300
+LOG_INTERVAL = 60
+LOG_BYTES = 256 * 1024
+
+# the order phases are reported in, nested phases follow the one they are
+# part of
+PHASES = [  'events', 'move', 'move.depart', 'move.age', 'move.select',
+            'move.allocate', 'journal', 'draw', 'draw.damage', 'draw.clock',
+            'draw.moves', 'draw.sidings', 'draw.rakes', 'update', 'wait' ]
+
+HEADINGS = ( 'phase', 'frames', 'p50 ms', 'p95 ms', 'max ms' )
+
+METHODS = [ ( 'handleNextMoveButton', 'move' ),
+            ( 'removeDepartedWagons', 'move.depart' ),
+            ( 'ageWagons', 'move.age' ),
+            ( 'selectOutgoing', 'move.select' ),
+            ( 'allocateWagons', 'move.allocate' ),
+            ( 'record', 'journal' ),
+            ( 'drawBoard', 'draw' ),
+            ( 'damagedRects', 'draw.damage' ),
+            ( 'drawClock', 'draw.clock' ),
+            ( 'drawMoves', 'draw.moves' ),
+            ( 'drawSiding', 'draw.sidings' ),
+            ( 'drawRakes', 'draw.rakes' ) ]
+
+class NullProfiler:
+    overlay = False
+
+    def instrument( self, obj ):
+        pass
+
+    def start( self, phase ):
+        pass
+
+    def stop( self, phase ):
+        pass
+
+    def endFrame( self ):
+        return False
+
+    def close( self ):
+        pass
+
+class Profiler:
+    def __init__( self, logName=None, overlay=False, window=WINDOW ):
+        self.overlay = overlay
+        self.window = window
+        self.samples = {}
+        self.current = {}
+        self.starts = {}
+        self.summary = []
+        self.summaryTime = 0
+        self.log = None
+        if logName != None:
+            self.log = logging.getLogger( 'stationmaster.profile' )
+            self.log.propagate = False
+            self.log.setLevel( logging.INFO )
+            handler = logging.handlers.RotatingFileHandler(
+                                logName,
+                                maxBytes=LOG_BYTES,
+                                backupCount=1 )
+            handler.setFormatter(
+                logging.Formatter( '%(asctime)s %(message)s' ) )
+            self.log.addHandler( handler )
+        self.logTime = time.time()
+
+    def instrument( self, obj ):
+        for (name,phase) in METHODS:
+            self.wrap( obj, name, phase )
+
+    def wrap( self, obj, name, phase ):
+        function = getattr( obj, name )
+        def timed( *args, **kwargs ):
+            start = time.time()
+            try:
+                return function( *args, **kwargs )
+            finally:
+                self.add( phase, time.time() - start )
+        setattr( obj, name, timed )
+
+    def start( self, phase ):
+        self.starts[ phase ] = time.time()
+
+    def stop( self, phase ):
+        self.add( phase, time.time() - self.starts.pop( phase ) )
+
+    def add( self, phase, elapsed ):
+        self.current[ phase ] = self.current.get( phase, 0 ) + elapsed
+
+    def endFrame( self ):
+        # commits the frame's timings, and returns True when the summary for
+        # the overlay has changed
+        for (phase,elapsed) in self.current.items():
+            if phase not in self.samples:
+                self.samples[ phase ] = collections.deque( maxlen=self.window )
+            self.samples[ phase ].append( elapsed )
+        self.current = {}
+        now = time.time()
+        changed = False
+        if self.overlay and now - self.summaryTime >= 1:
+            self.summary = self.report()
+            self.summaryTime = now
+            changed = True
+        if self.log != None and now - self.logTime >= LOG_INTERVAL:
+            self.writeLog()
+            self.logTime = now
+        return changed
+
+    def percentiles( self, phase ):
+        values = sorted( self.samples[ phase ] )
+        def percentile( p ):
+            return values[ min( len( values ) - 1, len( values ) * p / 100 ) ]
+        return ( percentile( 50 ), percentile( 95 ), values[-1] )
+
+    def report( self ):
+        # rows of phase, frames, median, 95th percentile and worst in ms
+        rows = []
+        for phase in PHASES:
+            if phase in self.samples:
+                (p50,p95,worst) = self.percentiles( phase )
+                rows.append( (  phase,
+                                str( len( self.samples[ phase ] ) ),
+                                "{:.1f}".format( p50 * 1000 ),
+                                "{:.1f}".format( p95 * 1000 ),
+                                "{:.1f}".format( worst * 1000 ) ) )
+        return rows
+
+    def writeLog( self ):
+        for row in [ HEADINGS ] + self.report():
+            self.log.info( "{:<14}{:>7}{:>8}{:>8}{:>8}".format( *row ) )
+
+    def close( self ):
+        if self.log != None:
+            self.writeLog()
+            for handler in self.log.handlers[:]:
+                handler.close()
+                self.log.removeHandler( handler )
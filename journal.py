@@ -0,0 +1,101 @@
+# Append-only journal of the events that change a stationmaster session, so
+# that a power cut loses at most the event being written. Each journal
+# starts with the generation of the state snapshot it follows on from, and
+# is only replayed on top of a snapshot of the same generation.
+
+import os, time
+
+
+class Journal:
+    def __init__( self, fileName ):
+        self.fileName = fileName
+        self.f = None
+        self.entries = 0
+
+    def start( self, generation ):
+        self.close()
+        self.f = open( self.fileName, "w" )
+        self.entries = 0
+        self.write( "g/{}\n".format( generation ) )
+
+    def record( self, *fields ):
+        self.write( "/".join( map( str, fields ) ) + "\n" )
+        self.entries = self.entries + 1
+
+    def write( self, line ):
+        self.f.write( line )
+        self.f.flush()
+        os.fsync( self.f.fileno() )
+
+    def close( self ):
+        if self.f != None:
+            self.f.close()
+            self.f = None
+
+class Recorder:
+    # timestamped log of the buttons pressed in a session, with the seed of
+    # each move, for replay.py to run again. It starts with the layout it
+    # was recorded on, and the state it started from is saved beside it.
+    def __init__( self, fileName, baseName ):
+        self.f = open( fileName, "w" )
+        self.start = time.time()
+        self.f.write( "b/{}\n".format( os.path.abspath( baseName ) ) )
+        self.f.flush()
+
+    def record( self, *fields ):
+        self.f.write( "{:.3f}/".format( time.time() - self.start )
+                      + "/".join( map( str, fields ) ) + "\n" )
+        self.f.flush()
+
+    def close( self ):
+        self.f.close()
+
+def readRecording( fileName ):
+    # returns the layout and the timestamp and fields of each button press
+    f = open( fileName )
+    lines = f.readlines()
+    f.close()
+    if len( lines ) == 0 or not lines[0].startswith( "b/" ):
+        raise ValueError( "{} is not a recorded session".format( fileName ) )
+    baseName = lines[0].strip()[2:]
+    presses = []
+    for line in lines[1:]:
+        if not line.endswith( "\n" ):
+            break
+        fields = line.strip().split( '/' )
+        presses.append( ( float( fields[0] ), fields[1:] ) )
+    return ( baseName, presses )
+
+def readJournal( fileName, generation ):
+    # returns the fields of each complete event, a line cut short by a power
+    # cut and anything after it are ignored
+    events = []
+    try:
+        f = open( fileName )
+    except IOError:
+        return events
+    lines = f.readlines()
+    f.close()
+    if len( lines ) > 0 and lines[0] == "g/{}\n".format( generation ):
+        for line in lines[1:]:
+            if not line.endswith( "\n" ):
+                break
+            events.append( line.strip().split( '/' ) )
+    return events
+
+def replaceFile( fileName, write ):
+    # writes a file through a temporary copy, so the old contents survive
+    # until the new ones are safely on disk
+    tempName = fileName + ".tmp"
+    f = open( tempName, "wb" )
+    write( f )
+    f.flush()
+    os.fsync( f.fileno() )
+    f.close()
+    os.rename( tempName, fileName )
+    directory = os.open( os.path.dirname( os.path.abspath( fileName ) ),
+                         os.O_RDONLY )
+    try:
+        os.fsync( directory )
+    finally:
+        os.close( directory )
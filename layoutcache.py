@@ -0,0 +1,132 @@
+# Compiled cache of a layout's parsed .wtt, .layout and .config files, kept
+# beside them as <baseName>.cache, so that starting a session is one small
+# sequential read rather than a parse of each file. The cache records the
+# size, modification time and SHA-1 of each source as they were before it
+# was parsed, and is only used while all of them still match.
+#
+# A source whose modification time is too close to when it was parsed to
+# show a later change, or whose time has changed, is checked by its hash,
+# so the cache is never used stale and is kept when a file is only touched.
+
+import os, sys, time, array, marshal, hashlib
+import statefile
+from journal import replaceFile
+
+
+VERSION = 1
+SOURCES = ( ".wtt", ".layout", ".config" )
+
+# FAT, as on an SD card, keeps modification times to 2 seconds
+MTIME_RESOLUTION = 2
+
+HASH_BLOCK = 64 * 1024
+
+# anything that changes how the arrays in the cache are laid out
+FORMAT = (  VERSION,
+            marshal.version,
+            sys.byteorder,
+            array.array( 'i' ).itemsize,
+            array.array( 'L' ).itemsize )
+
+def fileHash( fileName ):
+    digest = hashlib.sha1()
+    f = open( fileName, "rb" )
+    try:
+        block = f.read( HASH_BLOCK )
+        while block != "":
+            digest.update( block )
+            block = f.read( HASH_BLOCK )
+    finally:
+        f.close()
+    return digest.hexdigest()
+
+def fingerprints( baseName ):
+    # taken before the sources are parsed, so that a change made while they
+    # are counts against the cache
+    taken = time.time()
+    prints = []
+    for extension in SOURCES:
+        fileName = baseName + extension
+        stat = os.stat( fileName )
+        prints.append( ( stat.st_size, stat.st_mtime, fileHash( fileName ) ) )
+    return ( taken, prints )
+
+def checkSources( baseName, taken, prints ):
+    # returns None if any source has changed, otherwise the fingerprints
+    # they have now, or the same ones if no hash had to be checked
+    checked = False
+    now = time.time()
+    current = []
+    for (extension,(size,mtime,digest)) in zip( SOURCES, prints ):
+        fileName = baseName + extension
+        stat = os.stat( fileName )
+        if stat.st_size != size:
+            return None
+        if stat.st_mtime != mtime or mtime + MTIME_RESOLUTION >= taken:
+            if fileHash( fileName ) != digest:
+                return None
+            checked = True
+        current.append( ( size, stat.st_mtime, digest ) )
+    if checked:
+        return ( now, current )
+    return ( taken, prints )
+
+def load( baseName ):
+    # returns what was saved, or None if there is no cache or it is stale
+    try:
+        f = open( baseName + ".cache", "rb" )
+    except IOError:
+        return None
+    try:
+        (cacheFormat,taken,prints,data) = marshal.load( f )
+        current = None
+        if cacheFormat == FORMAT:
+            current = checkSources( baseName, taken, prints )
+    except ( EOFError, ValueError, TypeError ):
+        current = None
+    finally:
+        f.close()
+    if current == None:
+        return None
+    if current != ( taken, prints ):
+        # the sources were only touched, so the times they have now are
+        # saved to spare hashing them again next time
+        save( baseName, current, data )
+    return data
+
+def save( baseName, fingerprints, data ):
+    # data is anything marshal can write. A cache that cannot be written
+    # only costs the parse again next time.
+    (taken,prints) = fingerprints
+    try:
+        replaceFile(
+            baseName + ".cache",
+            lambda f: marshal.dump( ( FORMAT, taken, prints, data ), f ) )
+    except ( IOError, OSError ):
+        pass
+
+def packColumns( wagons ):
+    return (    wagons.types.tostring(),
+                wagons.ages.tostring(),
+                wagons.outgoing.tostring() )
+
+def unpackColumns( packed ):
+    wagons = statefile.WagonColumns()
+    wagons.types.fromstring( packed[0] )
+    wagons.ages.fromstring( packed[1] )
+    wagons.outgoing.fromstring( packed[2] )
+    return wagons
+
+def packConfig( config ):
+    return (    config.trainLength,
+                config.wagonTypes,
+                [ packColumns( rake ) for rake in config.rakes ],
+                [ packColumns( wagons ) for wagons in config.initial ] )
+
+def unpackConfig( packed ):
+    config = statefile.Config()
+    config.trainLength = packed[0]
+    config.wagonTypes = packed[1]
+    config.rakes = [ unpackColumns( rake ) for rake in packed[2] ]
+    config.initial = [ unpackColumns( wagons ) for wagons in packed[3] ]
+    return config
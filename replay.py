@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+# Replays a session recorded with stationmaster.py --record, feeding the
+# button presses into the same handlers as fast as they will go, from the
+# state the recording started in. The state it finishes in can be checked
+# against the one the real session saved, e.g.
+#
+#   ./stationmaster.py lion-mills --record monday.rec
+#   ./replay.py monday.rec --expect lion-mills.state
+#
+# The layout files are read from where they were recorded unless another
+# layout is given. Nothing is written next to them: the replay runs on a
+# copy in a temporary directory.
+
+import os, sys, time, shutil, tempfile, argparse
+import statefile
+from journal import readRecording
+from simulation import Simulation
+
+
+def replay( sim, presses ):
+    for (stamp,fields) in presses:
+        if fields[0] == 'n':
+            sim.handleNextMoveButton( int( fields[1] ) )
+        elif fields[0] == 's':
+            sim.handleWagonSelectButton()
+        elif fields[0] == 'c':
+            sim.handleWagonChangeButton()
+
+def compareStates( expected, actual ):
+    # returns a line for each difference, the generation only counts saves
+    # so is not compared
+    differences = []
+    if expected.moveIndex != actual.moveIndex:
+        differences.append( "move index {} expected {}".format(
+            actual.moveIndex, expected.moveIndex ) )
+    for (kind,expectedGroups,actualGroups) in (
+            ( 'siding', expected.sidings, actual.sidings ),
+            ( 'rake', expected.rakes, actual.rakes ) ):
+        if len( expectedGroups ) != len( actualGroups ):
+            differences.append( "{} {}s expected {}".format(
+                len( actualGroups ), kind, len( expectedGroups ) ) )
+        for idx in range( min( len( expectedGroups ), len( actualGroups ) ) ):
+            if expectedGroups[ idx ].rows() != actualGroups[ idx ].rows():
+                differences.append( "{} {}: {} expected {}".format(
+                    kind,
+                    idx,
+                    statefile.formatWagons( actualGroups[ idx ] ),
+                    statefile.formatWagons( expectedGroups[ idx ] ) ) )
+    return differences
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a recorded stationmaster session' )
+    parser.add_argument( 'recording' )
+    parser.add_argument( '--layout', metavar='BASENAME',
+        help='layout files to use in place of the recorded ones' )
+    parser.add_argument( '--expect', metavar='STATE',
+        help='state file the replay should finish in' )
+    parser.add_argument( '--save', metavar='STATE',
+        help='write the state the replay finishes in to STATE' )
+    parser.add_argument( '--draw', action='store_true',
+        help='draw the board off-screen after each press, to time drawing' )
+    args = parser.parse_args()
+
+    (baseName,presses) = readRecording( args.recording )
+    if args.layout != None:
+        baseName = args.layout
+
+    directory = tempfile.mkdtemp( prefix='stationmaster-replay-' )
+    try:
+        copyName = os.path.join( directory, os.path.basename( baseName ) )
+        for extension in ( ".wtt", ".layout", ".config" ):
+            shutil.copy( baseName + extension, copyName + extension )
+        shutil.copy( args.recording + ".state", copyName + ".state" )
+
+        start = time.time()
+        if args.draw:
+            import pygame
+            from stationmaster import Game, DESIGN_WIDTH, DESIGN_HEIGHT
+            pygame.font.init()
+            sim = Game( copyName, pygame.Surface(
+                                    ( DESIGN_WIDTH, DESIGN_HEIGHT ), 0, 32 ) )
+            # journalling would time the disk rather than the presses
+            sim.closeJournal()
+            sim.start()
+            sim.drawBoard()
+            loaded = time.time()
+            for press in presses:
+                replay( sim, [ press ] )
+                sim.drawBoard()
+        else:
+            sim = Simulation( copyName )
+            loaded = time.time()
+            replay( sim, presses )
+        elapsed = time.time() - loaded
+        moves = len( [ press for press in presses if press[1][0] == 'n' ] )
+        print( "{} presses, {} moves, loaded in {:.3f}s, replayed in {:.3f}s"
+               " ({:.2f} ms a press)".format(
+                    len( presses ),
+                    moves,
+                    loaded - start,
+                    elapsed,
+                    elapsed * 1000 / max( len( presses ), 1 ) ) )
+
+        sim.saveState()
+        actual = statefile.readState( copyName + ".state" )
+        if args.save != None:
+            shutil.copy( copyName + ".state", args.save )
+    finally:
+        shutil.rmtree( directory )
+
+    if args.expect != None:
+        differences = compareStates(
+                        statefile.readState( args.expect ),
+                        actual )
+        for difference in differences:
+            print( difference )
+        if len( differences ) > 0:
+            sys.exit( 1 )
+        print( "state matches {}".format( args.expect ) )
+
+if __name__ == '__main__':
+    main()
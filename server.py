@@ -0,0 +1,198 @@
+#!/usr/bin/python
+
+# Runs several stationmaster sessions in one process and serves them over
+# HTTP, to clients that show the board and send the button presses, e.g.
+#
+#   ./server.py lion-mills other-layout
+#   curl -o board.png http://localhost:8000/lion-mills/frame.png
+#   curl http://localhost:8000/lion-mills/state
+#   curl -X POST http://localhost:8000/lion-mills/next
+#
+# Nothing runs for a session between requests: its clock is caught up and
+# its board drawn only when a client asks, and frames and state carry an
+# ETag so that polling a session that has not changed costs next to nothing.
+
+import os, sys, json, time, shutil, signal, tempfile, threading, argparse
+import BaseHTTPServer, SocketServer
+
+os.environ.setdefault( 'SDL_VIDEODRIVER', 'dummy' )
+
+import pygame
+from stationmaster import Game
+
+
+SCREEN_SIZE = ( 800, 480 )
+
+# pygame's font rendering and image saving are shared by all the sessions
+RENDER_LOCK = threading.Lock()
+
+class Session:
+    def __init__( self, baseName, size, directory ):
+        self.name = os.path.basename( baseName )
+        self.lock = threading.Lock()
+        self.game = Game( baseName, pygame.Surface( size, 0, 32 ) )
+        self.game.start()
+        self.changes = 0
+        self.frames = 0
+        self.png = None
+        self.frameName = os.path.join( directory, self.name + ".png" )
+        self.clockTick = time.time()
+
+    def tick( self ):
+        # runs the clock up to the next move at the rate the display would
+        game = self.game
+        now = time.time()
+        if game.time < game.moveTime:
+            steps = int( ( now - self.clockTick ) * game.fps )
+            if steps > 0:
+                game.time = min( game.moveTime, game.time + steps )
+                game.invalidate( 'clock' )
+                self.clockTick = self.clockTick + float( steps ) / game.fps
+        else:
+            self.clockTick = now
+
+    def press( self, button ):
+        with self.lock:
+            self.tick()
+            if button == 'next':
+                self.game.handleNextMoveButton()
+            elif button == 'select':
+                self.game.handleWagonSelectButton()
+            elif button == 'change':
+                self.game.handleWagonChangeButton()
+            self.changes = self.changes + 1
+
+    def frame( self ):
+        with self.lock:
+            self.tick()
+            with RENDER_LOCK:
+                if len( self.game.drawBoard() ) > 0 or self.png == None:
+                    pygame.image.save( self.game.surface, self.frameName )
+                    f = open( self.frameName, "rb" )
+                    self.png = f.read()
+                    f.close()
+                    self.frames = self.frames + 1
+            return ( self.frames, self.png )
+
+    def state( self ):
+        with self.lock:
+            self.tick()
+            game = self.game
+            def wagons( wagonList ):
+                return [    [ wagon.text( game.wagonTypes ),
+                              wagon.age,
+                              bool( wagon.outgoing ) ]
+                            for wagon in wagonList ]
+            moves = []
+            for idx in range( game.moveIndex - 1, game.moveIndex + 2 ):
+                if idx >= 0 and idx < len( game.moves ) \
+                   and game.moves[ idx ] != None:
+                    move = game.moves[ idx ]
+                    moves.append( [ move.clockTime,
+                                    move.amPm,
+                                    move.description ] )
+            state = {   'time': game.time,
+                        'moveTime': game.moveTime,
+                        'moveIndex': game.moveIndex,
+                        'moves': moves,
+                        'sidings': [    wagons( siding.wagons )
+                                        for siding in game.sidings ],
+                        'rakes': [ wagons( rake ) for rake in game.rakes ],
+                        'nextRake': game.nextRake,
+                        'selection': list( game.selection ) }
+            return (    "{}-{}".format( self.changes, game.time ),
+                        json.dumps( state ) )
+
+    def close( self ):
+        with self.lock:
+            self.game.closeJournal()
+
+class Handler( BaseHTTPServer.BaseHTTPRequestHandler ):
+    def route( self ):
+        fields = self.path.split( '?' )[0].strip( '/' ).split( '/' )
+        session = self.server.sessions.get( fields[0] )
+        if session == None or len( fields ) != 2:
+            self.send_error( 404 )
+            return ( None, None )
+        return ( session, fields[1] )
+
+    def do_GET( self ):
+        if self.path == '/':
+            self.reply( None,
+                        json.dumps( sorted( self.server.sessions.keys() ) ),
+                        'application/json' )
+            return
+        (session,resource) = self.route()
+        if resource == 'frame.png':
+            (tag,body) = session.frame()
+            self.reply( tag, body, 'image/png' )
+        elif resource == 'state':
+            (tag,body) = session.state()
+            self.reply( tag, body, 'application/json' )
+        elif session != None:
+            self.send_error( 404 )
+
+    def do_POST( self ):
+        (session,button) = self.route()
+        if button in ( 'next', 'select', 'change' ):
+            session.press( button )
+            self.send_response( 204 )
+            self.end_headers()
+        elif session != None:
+            self.send_error( 404 )
+
+    def reply( self, tag, body, contentType ):
+        if tag != None:
+            tag = '"{}"'.format( tag )
+        if tag != None and self.headers.get( 'If-None-Match' ) == tag:
+            self.send_response( 304 )
+            self.send_header( 'ETag', tag )
+            self.end_headers()
+        else:
+            self.send_response( 200 )
+            self.send_header( 'Content-Type', contentType )
+            self.send_header( 'Content-Length', str( len( body ) ) )
+            if tag != None:
+                self.send_header( 'ETag', tag )
+            self.end_headers()
+            self.wfile.write( body )
+
+class Server( SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer ):
+    daemon_threads = True
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve several stationmaster sessions over HTTP' )
+    parser.add_argument( 'baseNames', nargs='+', metavar='baseName',
+        help='layout to run, the path of its files without the extension' )
+    parser.add_argument( '--host', default='127.0.0.1' )
+    parser.add_argument( '-p', '--port', type=int, default=8000 )
+    parser.add_argument( '--size', nargs=2, type=int,
+        default=SCREEN_SIZE, metavar=( 'WIDTH', 'HEIGHT' ) )
+    args = parser.parse_args()
+
+    names = [ os.path.basename( baseName ) for baseName in args.baseNames ]
+    if len( set( names ) ) != len( names ):
+        parser.error( "each layout must have a different name" )
+
+    # stopping the service should close the journals as ^C does
+    signal.signal( signal.SIGTERM, lambda signum, frame: sys.exit( 0 ) )
+    pygame.font.init()
+    directory = tempfile.mkdtemp( prefix='stationmaster-server-' )
+    server = Server( ( args.host, args.port ), Handler )
+    server.sessions = {}
+    try:
+        for baseName in args.baseNames:
+            session = Session( baseName, args.size, directory )
+            server.sessions[ session.name ] = session
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for session in server.sessions.values():
+            session.close()
+        shutil.rmtree( directory )
+
+if __name__ == '__main__':
+    main()
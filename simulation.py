@@ -0,0 +1,913 @@
+#!/usr/bin/python
+
+# Operating logic for stationmaster, free of any display or GPIO code so it
+# can be imported and driven headlessly, e.g. to batch run sessions against a
+# new timetable or layout.
+
+import os, random, copy, heapq, array, bisect, itertools, argparse
+from journal import Journal, Recorder, readJournal, replaceFile
+from statefile import FormatError, numberedLines
+import statefile, layoutcache
+
+
+COMPACT_INTERVAL = 50
+MOVE_WINDOW = 8
+
+# how far the running length of the outgoing wagons may have drifted, and
+# the finest fraction of a wagon length that is always added exactly
+NEAR_TRAIN_LENGTH = 1e-6
+EXACT_FRACTION = 1024
+CHANGED_DESCRIPTION = "(WTT changed, restart to reload)"
+
+TYPE = 0
+TIME = 1
+AM_PM = 2
+DESCRIPTION = 3
+
+def incrementIndex( currentValue, limit ):
+    newValue = currentValue + 1
+    if newValue >= limit:
+        newValue = 0
+    return newValue
+
+class Move( object ):
+    __slots__ = ( 'moveType', 'minutes', 'clockTime', 'amPm', 'description' )
+
+    def __init__( self, move ):
+        fields = move.split( '/', DESCRIPTION )
+        if len( fields ) <= DESCRIPTION:
+            raise ValueError( "expected type/time/am_pm/description" )
+        self.moveType = fields[TYPE]
+        self.clockTime = fields[TIME]
+        self.amPm = fields[AM_PM]
+        self.description = fields[DESCRIPTION]
+        self.minutes = parseTime( self.clockTime, self.amPm )
+
+def parseTime( clockTime, amPm ):
+    # minutes since midnight of a 12 hour clock time, as in the WTT
+    try:
+        (hour,minute) = map( int, clockTime.split( ':' ) )
+    except ValueError:
+        raise ValueError( "bad time '{}'".format( clockTime ) )
+    if hour == 12:
+        hour = 0
+    if amPm == "pm":
+        hour = hour + 12
+    return hour * 60 + minute
+
+class Timetable:
+    # the moves of a WTT kept as arrays of their times, types and where they
+    # are in the file, so a timetable of any length takes a few bytes a move.
+    # Only a window of moves around the last one asked for is parsed into
+    # Move objects, for display. Blank lines are kept as None so move indices
+    # in saved state match the lines of the file.
+    def __init__( self, fileName, packed=None ):
+        self.fileName = fileName
+        self.minutes = array.array( 'i' )
+        self.types = array.array( 'H' )
+        self.offsets = array.array( 'L' )
+        self.typeNames = []
+        self.window = {}
+        if packed != None:
+            # the arrays as packed for the layout cache
+            self.minutes.fromstring( packed[0] )
+            self.types.fromstring( packed[1] )
+            self.offsets.fromstring( packed[2] )
+            self.typeNames = packed[3]
+            self.stamp = self.fileStamp( os.stat( fileName ) )
+        else:
+            self.parse()
+
+    def parse( self ):
+        fileName = self.fileName
+        typeCodes = {}
+        f = open( fileName, "rb" )
+        try:
+            # every line is parsed once up front, so a bad one is reported
+            # when the file is loaded rather than when the move comes up
+            for (lineNumber,offset,line) in numberedLines( f ):
+                if line != "":
+                    try:
+                        move = Move( line )
+                    except ValueError as e:
+                        raise FormatError( fileName, lineNumber, e )
+                    if move.moveType not in typeCodes:
+                        typeCodes[ move.moveType ] = len( self.typeNames )
+                        self.typeNames.append( move.moveType )
+                    self.minutes.append( move.minutes )
+                    self.types.append( typeCodes[ move.moveType ] )
+                else:
+                    self.minutes.append( -1 )
+                    self.types.append( 0 )
+                self.offsets.append( offset )
+            self.stamp = self.fileStamp( os.fstat( f.fileno() ) )
+        finally:
+            f.close()
+
+    def pack( self ):
+        return (    self.minutes.tostring(),
+                    self.types.tostring(),
+                    self.offsets.tostring(),
+                    self.typeNames )
+
+    def fileStamp( self, stat ):
+        return ( stat.st_size, stat.st_mtime )
+
+    def __len__( self ):
+        return len( self.minutes )
+
+    def __getitem__( self, idx ):
+        if self.minutes[ idx ] < 0:
+            return None
+        if idx not in self.window:
+            self.readWindow( idx )
+        return self.window[ idx ]
+
+    def moveType( self, idx ):
+        if self.minutes[ idx ] < 0:
+            return None
+        return self.typeNames[ self.types[ idx ] ]
+
+    def readWindow( self, idx ):
+        # the move before is included as the board shows it too
+        start = max( idx - 1, 0 )
+        end = min( start + MOVE_WINDOW, len( self.minutes ) )
+        self.window = {}
+        try:
+            f = open( self.fileName, "rb" )
+        except IOError:
+            f = None
+        try:
+            if f != None \
+            and self.fileStamp( os.fstat( f.fileno() ) ) == self.stamp:
+                f.seek( self.offsets[ start ] )
+                for moveIndex in xrange( start, end ):
+                    line = f.readline().strip()
+                    if line != "":
+                        self.window[ moveIndex ] = Move( line )
+            else:
+                # the file has been edited or removed since it was loaded,
+                # so its lines are no longer where they were. The board is
+                # drawn from here, so rather than stop it the moves are made
+                # up from what was kept of them, without their descriptions.
+                for moveIndex in xrange( start, end ):
+                    if self.minutes[ moveIndex ] >= 0:
+                        self.window[ moveIndex ] = self.keptMove( moveIndex )
+        finally:
+            if f != None:
+                f.close()
+
+    def keptMove( self, idx ):
+        (hour,minute) = divmod( self.minutes[ idx ], 60 )
+        if hour >= 12:
+            amPm = "pm"
+        else:
+            amPm = "am"
+        hour = hour % 12
+        if hour == 0:
+            hour = 12
+        return Move( "{}/{}:{:02d}/{}/{}".format(
+                        self.moveType( idx ),
+                        hour,
+                        minute,
+                        amPm,
+                        CHANGED_DESCRIPTION ) )
+
+def parseVertex( vertex ):
+    coords = vertex.split( ',' )
+    return ( int( coords[0] ), int( coords[1] ) )
+
+def parseLayout( fileName ):
+    # the length, wagon types and vertices of each siding
+    sidings = []
+    f = open( fileName, "rb" )
+    try:
+        for (lineNumber,offset,line) in numberedLines( f ):
+            if line != "" and line[0] != '#':
+                try:
+                    (length,types,vertices) = line.split( '/' )
+                    if types != '':
+                        types = [ int( wt ) for wt in types.split( ',' ) ]
+                    else:
+                        types = []
+                    sidings.append( (   int( length ),
+                                        types,
+                                        [   parseVertex( vertex )
+                                            for vertex in vertices.split( ';' )
+                                        ] ) )
+                except ( ValueError, IndexError ) as e:
+                    raise FormatError( fileName, lineNumber, e )
+    finally:
+        f.close()
+    return sidings
+
+class Sources:
+    # the parsed .wtt, .layout and .config of a layout, from the layout cache
+    # when it is up to date and parsed into it when it is not
+    def __init__( self, baseName ):
+        self.baseName = baseName
+        packed = layoutcache.load( baseName )
+        if packed != None:
+            self.timetable = Timetable( baseName + ".wtt", packed[0] )
+            self.layout = packed[1]
+            self.config = layoutcache.unpackConfig( packed[2] )
+        else:
+            fingerprints = layoutcache.fingerprints( baseName )
+            self.timetable = Timetable( baseName + ".wtt" )
+            self.layout = parseLayout( baseName + ".layout" )
+            self.config = statefile.readConfig( baseName + ".config" )
+            layoutcache.save(
+                baseName,
+                fingerprints,
+                (   self.timetable.pack(),
+                    self.layout,
+                    layoutcache.packConfig( self.config ) ) )
+
+class WagonType:
+    def __init__( self, name, length ):
+        self.name = name
+        self.length = length
+
+class WagonMethods( object ):
+    # what Wagon and WagonView share, on top of wagonType, age and outgoing
+    __slots__ = ()
+
+    def reset( self ):
+        self.age = 0
+        self.outgoing = False
+
+    def incrAge( self, rng=random ):
+        incr = rng.randint( 1, 5 )
+        self.age = self.age + incr
+
+    def markOutgoing( self ):
+        self.outgoing = True
+
+    def isOutgoing( self ):
+        return self.outgoing
+
+    def text( self, wagonTypes ):
+        if self.wagonType < len( wagonTypes ):
+            val = wagonTypes[ self.wagonType ].name
+        else:
+            val = '?'
+        return val
+
+    def length( self, wagonTypes ):
+        if self.wagonType < len( wagonTypes ):
+            val = wagonTypes[ self.wagonType ].length
+        else:
+            val = 1
+        return val
+
+    def width( self, baseWidth, wagonTypes ):
+        return self.length( wagonTypes ) * baseWidth
+
+class Wagon( WagonMethods ):
+    __slots__ = ( 'wagonType', 'age', 'outgoing', 'selected' )
+
+    def __init__( self, wagonType, age=0, outgoing=False ):
+        self.wagonType = wagonType
+        self.age = age
+        self.outgoing = outgoing
+        self.selected = False
+
+    def copy( self ):
+        return Wagon( self.wagonType, self.age, self.outgoing )
+
+class WagonView( WagonMethods ):
+    # a wagon stored in the columns of a WagonStore, only valid until wagons
+    # are added to or taken from the store
+    __slots__ = ( 'store', 'index' )
+
+    def __init__( self, store, index ):
+        self.store = store
+        self.index = index
+
+    def getType( self ):
+        return self.store.types[ self.index ]
+
+    def setType( self, wagonType ):
+        self.store.types[ self.index ] = wagonType
+
+    def getAge( self ):
+        return self.store.ages[ self.index ]
+
+    def setAge( self, age ):
+        self.store.ages[ self.index ] = age
+
+    def getOutgoing( self ):
+        return self.store.outgoing[ self.index ] != 0
+
+    def setOutgoing( self, outgoing ):
+        self.store.outgoing[ self.index ] = outgoing
+
+    wagonType = property( getType, setType )
+    age = property( getAge, setAge )
+    outgoing = property( getOutgoing, setOutgoing )
+
+class WagonStore:
+    # the wagons in a siding, held as parallel arrays of type, age and
+    # outgoing flag rather than as objects
+    def __init__( self, columns=None ):
+        if columns == None:
+            columns = statefile.WagonColumns()
+        self.types = columns.types
+        self.ages = columns.ages
+        self.outgoing = columns.outgoing
+
+    def __len__( self ):
+        return len( self.types )
+
+    def __iter__( self ):
+        for idx in xrange( len( self.types ) ):
+            yield WagonView( self, idx )
+
+    def __getitem__( self, idx ):
+        if idx < 0:
+            idx = idx + len( self.types )
+        if idx < 0 or idx >= len( self.types ):
+            raise IndexError( idx )
+        return WagonView( self, idx )
+
+    def append( self, wagon ):
+        self.types.append( wagon.wagonType )
+        self.ages.append( wagon.age )
+        self.outgoing.append( wagon.outgoing )
+
+    def copy( self ):
+        store = WagonStore()
+        store.types.extend( self.types )
+        store.ages.extend( self.ages )
+        store.outgoing.extend( self.outgoing )
+        return store
+
+    def columns( self ):
+        columns = statefile.WagonColumns()
+        columns.types = self.types
+        columns.ages = self.ages
+        columns.outgoing = self.outgoing
+        return columns
+
+    def ageWagons( self, rng=random ):
+        # the same draws as Wagon.incrAge, randint( 1, 5 ) is exactly this
+        rand = rng.random
+        self.ages = array.array(
+                        self.ages.typecode,
+                        [ age + 1 + int( rand() * 5 ) for age in self.ages ] )
+
+    def takeOutgoing( self ):
+        # removes the outgoing wagons, returning them as Wagon objects
+        outgoing = self.outgoing
+        if not any( outgoing ):
+            return []
+        staying = [ not flag for flag in outgoing ]
+        taken = [   Wagon( wagonType, age, True )
+                    for (wagonType,age) in itertools.compress(
+                        zip( self.types, self.ages ),
+                        outgoing ) ]
+        self.types = array.array(
+                        self.types.typecode,
+                        itertools.compress( self.types, staying ) )
+        self.ages = array.array(
+                        self.ages.typecode,
+                        itertools.compress( self.ages, staying ) )
+        self.outgoing = array.array(
+                            self.outgoing.typecode,
+                            [ 0 ] * len( self.types ) )
+        return taken
+
+def wagonsFromColumns( columns ):
+    return [    Wagon( wagonType, age, bool( outgoing ) )
+                for (wagonType,age,outgoing) in columns.rows() ]
+
+def columnsFromWagons( wagons ):
+    columns = statefile.WagonColumns()
+    for wagon in wagons:
+        columns.append( wagon.wagonType, wagon.age, wagon.outgoing )
+    return columns
+
+class OutgoingSelection:
+    # the oldest wagons that fit in one train, kept as a min-heap on age
+    # with the running total of their lengths; ties go to the wagon seen
+    # first, as they did when the youngest was searched for in a list.
+    # Lengths such as 1.2 are not exact in binary, so with them the running
+    # total drifts, and near the train length the lengths are summed afresh
+    # in the order the wagons were seen, as they were when the list was.
+    def __init__( self, trainLength, wagonTypes ):
+        self.trainLength = trainLength
+        self.wagonTypes = wagonTypes
+        self.typeLengths = [ wagonType.length for wagonType in wagonTypes ]
+        # whole numbers and halves, quarters and so on add up exactly
+        self.exact = all( [ float( length * EXACT_FRACTION ).is_integer()
+                            for length in self.typeLengths + [ 1 ] ] )
+        self.heap = []
+        self.totalLength = 0
+        self.count = 0
+
+    def append( self, wagon ):
+        length = wagon.length( self.wagonTypes )
+        if not self.rejects( wagon.age, length ):
+            self.add( wagon.age, length, wagon )
+
+    def rejects( self, age, length ):
+        # a wagon younger than all the others that doesn't fit would be the
+        # first one dropped again
+        return  len( self.heap ) > 0 \
+                and age < self.heap[0][0] \
+                and self.tooLong( length )
+
+    def add( self, age, length, wagon ):
+        heapq.heappush( self.heap, ( age, self.count, length, wagon ) )
+        self.count = self.count + 1
+        self.totalLength = self.totalLength + length
+        while len( self.heap ) > 0 and self.tooLong():
+            youngest = heapq.heappop( self.heap )
+            self.totalLength = self.totalLength - youngest[2]
+        if len( self.heap ) == 0:
+            self.totalLength = 0
+
+    def tooLong( self, extra=0 ):
+        # whether the wagons, and one more of length extra after them, are
+        # longer than the train
+        total = self.totalLength + extra
+        if self.exact or abs( total - self.trainLength ) > NEAR_TRAIN_LENGTH:
+            return total > self.trainLength
+        self.totalLength = 0
+        for entry in sorted( self.heap, key=lambda entry: entry[1] ):
+            self.totalLength = self.totalLength + entry[2]
+        return self.totalLength + extra > self.trainLength
+
+    def wagons( self ):
+        return [ wagon for (age,order,length,wagon) in self.heap ]
+
+class SidingPool:
+    # sidings with room for another wagon, kept in layout order so that a
+    # random pick depends only on which have room, as a session recovered
+    # from its journal builds its pools afresh. A pick is O(1), but adding
+    # or removing a siding shifts the list, O(n) in the sidings of the type.
+    def __init__( self, sidings ):
+        self.order = dict( ( siding, idx )
+                           for (idx,siding) in enumerate( sidings ) )
+        self.keys = []
+        self.sidings = []
+
+    def __len__( self ):
+        return len( self.sidings )
+
+    def add( self, siding ):
+        key = self.order[ siding ]
+        idx = bisect.bisect( self.keys, key )
+        self.keys.insert( idx, key )
+        self.sidings.insert( idx, siding )
+
+    def remove( self, siding ):
+        idx = bisect.bisect_left( self.keys, self.order[ siding ] )
+        del self.keys[ idx ]
+        del self.sidings[ idx ]
+
+    def choose( self, rng ):
+        return self.sidings[ rng.randint( 0, len( self.sidings ) - 1 ) ]
+
+class Siding:
+    def __init__( self, length, wagonTypes, vertices, sim ):
+        self.length = length
+        self.wagonTypes = set( wagonTypes )
+        self.vertices = [ sim.placeVertex( vertex ) for vertex in vertices ]
+        self.wagons = WagonStore()
+        self.overflows = 0
+
+    def hasRoom( self ):
+        return len( self.wagons ) < self.length
+
+    def copy( self ):
+        siding = copy.copy( self )
+        siding.wagons = self.wagons.copy()
+        siding.overflows = 0
+        return siding
+
+    def ageWagons( self, rng=random ):
+        self.wagons.ageWagons( rng )
+
+    def selectOutgoing( self, selection ):
+        wagons = self.wagons
+        lengths = selection.typeLengths
+        for idx in xrange( len( wagons ) ):
+            wagonType = wagons.types[ idx ]
+            if wagonType < len( lengths ):
+                length = lengths[ wagonType ]
+            else:
+                length = 1
+            age = wagons.ages[ idx ]
+            if not selection.rejects( age, length ):
+                selection.add( age, length, WagonView( wagons, idx ) )
+
+    def transferOutgoing( self, rake ):
+        rake.extend( self.wagons.takeOutgoing() )
+
+    def accepts( self, wagon ):
+        return wagon.wagonType in self.wagonTypes
+
+    def save( self ):
+        return self.wagons.columns()
+
+    def load( self, columns ):
+        self.wagons = WagonStore( columns )
+
+class Simulation:
+    def __init__( self, baseName, seed=None, useState=True ):
+        self.baseName = baseName
+        self.random = random.Random( seed )
+        self.moves = []
+        self.wagonTypes = []
+        self.rakes = []
+        self.nextRake = 0
+        self.selection = ()
+        self.sidings = []
+        self.sidingsByType = {}
+        self.freeSidings = None
+        self.trainLength = 1
+        self.moveIndex = 0
+        self.moveTime = 0
+        self.time = 0
+        self.generation = 0
+        self.binaryState = False
+        self.journal = None
+        self.recorder = None
+        self.starvedRakes = 0
+        self.parsed = None
+        self.loadWTT( baseName )
+        self.loadLayout( baseName )
+        self.loadState( baseName, useState )
+        self.parsed = None
+        self.nextMoveTime()
+
+    def copy( self, seed=None ):
+        sim = copy.copy( self )
+        sim.random = random.Random( seed )
+        sim.sidings = [ siding.copy() for siding in self.sidings ]
+        sim.indexSidings()
+        sim.rakes = [   [ wagon.copy() for wagon in rake ]
+                        for rake in self.rakes ]
+        sim.selection = ()
+        sim.journal = None
+        sim.recorder = None
+        sim.starvedRakes = 0
+        return sim
+
+    def placeVertex( self, vertex ):
+        # where a vertex of the layout file is on the board
+        return vertex
+
+    def sources( self, baseName ):
+        # the parsed files are shared by the loads of one layout
+        if self.parsed == None or self.parsed.baseName != baseName:
+            self.parsed = Sources( baseName )
+        return self.parsed
+
+    def loadWTT( self, baseName ):
+        self.moves = self.sources( baseName ).timetable
+
+    def loadLayout( self, baseName ):
+        for (length,wagonTypes,vertices) in self.sources( baseName ).layout:
+            self.sidings.append( Siding( length, wagonTypes, vertices, self ) )
+        self.indexSidings()
+
+    def indexSidings( self ):
+        # sidings accepting each wagon type, in layout order
+        self.sidingsByType = {}
+        for siding in self.sidings:
+            for wagonType in siding.wagonTypes:
+                self.sidingsByType.setdefault( wagonType, [] ).append( siding )
+        self.freeSidings = None
+
+    def freeSidingsByType( self ):
+        # built on demand and then kept up to date as wagons are allocated
+        # and transferred out, anything else that moves wagons just drops it
+        if self.freeSidings == None:
+            self.freeSidings = {}
+            for (wagonType,sidings) in self.sidingsByType.items():
+                pool = SidingPool( sidings )
+                for siding in sidings:
+                    if siding.hasRoom():
+                        pool.add( siding )
+                self.freeSidings[ wagonType ] = pool
+        return self.freeSidings
+
+    def loadState( self, baseName, useState=True ):
+        state = None
+        if useState:
+            try:
+                state = statefile.readState( baseName + ".state" )
+            except IOError:
+                state = None
+
+        config = self.sources( baseName ).config
+        self.trainLength = config.trainLength
+        if config.wagonTypes != None:
+            self.wagonTypes = [ WagonType( name, length )
+                                for (name,length) in config.wagonTypes ]
+            self.wagonTypes.append( WagonType( "", 0 ) )
+        if state == None:
+            for rake in config.rakes:
+                self.rakes.append( wagonsFromColumns( rake ) )
+            for wagons in config.initial:
+                self.allocateWagons( wagonsFromColumns( wagons ) )
+        else:
+            self.moveIndex = state.moveIndex
+            self.generation = state.generation
+            self.binaryState = state.binary
+            for (siding,wagons) in zip( self.sidings, state.sidings ):
+                siding.load( wagons )
+            for rake in state.rakes:
+                self.rakes.append( wagonsFromColumns( rake ) )
+            self.freeSidings = None
+
+    def saveState( self ):
+        replaceFile( self.baseName + ".state", self.writeState )
+
+    def writeState( self, f ):
+        state = statefile.State()
+        state.moveIndex = self.moveIndex
+        state.generation = self.generation
+        state.sidings = [ siding.save() for siding in self.sidings ]
+        nextRake = self.nextRake
+        allRakesWritten = False
+        while not allRakesWritten:
+            rake = self.rakes[ nextRake ]
+            state.rakes.append( columnsFromWagons( rake ) )
+            nextRake = incrementIndex( nextRake, len( self.rakes ) )
+            allRakesWritten = nextRake == self.nextRake
+        if self.binaryState:
+            statefile.writeBinaryState( state, f )
+        else:
+            statefile.writeTextState( state, f )
+
+    def openJournal( self ):
+        # replays whatever was journalled since the last snapshot, then
+        # folds it into a new one and starts journalling afresh
+        fileName = self.baseName + ".journal"
+        for fields in readJournal( fileName, self.generation ):
+            self.applyEvent( fields )
+        self.journal = Journal( fileName )
+        self.compact()
+
+    def compact( self ):
+        self.generation = self.generation + 1
+        self.saveState()
+        self.journal.start( self.generation )
+
+    def closeJournal( self ):
+        self.compact()
+        self.journal.close()
+        self.journal = None
+
+    def record( self, *fields ):
+        if self.journal != None:
+            self.journal.record( *fields )
+            if self.journal.entries >= COMPACT_INTERVAL:
+                self.compact()
+
+    def startRecording( self, fileName ):
+        replaceFile( fileName + ".state", self.writeState )
+        self.recorder = Recorder( fileName, self.baseName )
+
+    def stopRecording( self ):
+        if self.recorder != None:
+            self.recorder.close()
+            self.recorder = None
+
+    def recordPress( self, *fields ):
+        if self.recorder != None:
+            self.recorder.record( *fields )
+
+    def applyEvent( self, fields ):
+        if fields[0] == 'n':
+            self.handleNextMoveButton( int( fields[1] ) )
+        elif fields[0] == 'c' or fields[0] == 'd':
+            # rakes are journalled relative to the next one to leave, which
+            # is how saving the state orders them
+            self.selection = (
+                ( int( fields[1] ) + self.nextRake ) % len( self.rakes ),
+                int( fields[2] ) )
+            if fields[0] == 'c':
+                self.handleWagonChangeButton()
+            else:
+                self.handleWagonSelectButton()
+            self.selection = ()
+
+    def journalledSelection( self ):
+        # rakes are journalled relative to the next one to leave
+        return (    ( self.selection[0] - self.nextRake ) % len( self.rakes ),
+                    self.selection[1] )
+
+    def nextMoveTime( self ):
+        if self.moveIndex < len( self.moves ):
+            self.moveTime = max( self.moves.minutes[ self.moveIndex ], 0 )
+
+    def allocateWagons( self, train ):
+        freeSidings = self.freeSidingsByType()
+        for wagon in train:
+            pool = freeSidings.get( wagon.wagonType )
+            if pool != None and len( pool ) > 0:
+                siding = pool.choose( self.random )
+                siding.wagons.append( wagon )
+                if not siding.hasRoom():
+                    for wagonType in siding.wagonTypes:
+                        freeSidings[ wagonType ].remove( siding )
+            else:
+                siding = self.sidingsByType.get( wagon.wagonType, [] )[0]
+                siding.wagons.append( wagon )
+                siding.overflows = siding.overflows + 1
+
+    def selectOutgoing( self ):
+        selection = OutgoingSelection( self.trainLength, self.wagonTypes )
+        [ siding.selectOutgoing( selection ) for siding in self.sidings ]
+        [ wagon.markOutgoing() for wagon in selection.wagons() ]
+
+    def ageWagons( self ):
+        for siding in self.sidings:
+            siding.ageWagons( self.random )
+
+    def transferOutgoing( self, rake ):
+        for siding in self.sidings:
+            full = not siding.hasRoom()
+            siding.transferOutgoing( rake )
+            if full and siding.hasRoom() and self.freeSidings != None:
+                # the others with room are in their pools already
+                for wagonType in siding.wagonTypes:
+                    self.freeSidings[ wagonType ].add( siding )
+        [ wagon.reset() for wagon in rake ]
+
+    def removeDepartedWagons( self ):
+        if self.moves.moveType( self.moveIndex ) == '-':
+            rake = self.rakes[ self.nextRake ]
+            self.transferOutgoing( rake )
+            if len( rake ) == 0:
+                self.starvedRakes = self.starvedRakes + 1
+            self.nextRake = incrementIndex(
+                                self.nextRake,
+                                len( self.rakes ) )
+
+    def handleNextMoveButton( self, seed=None ):
+        # each move reseeds the generator so it can be replayed from the seed
+        if seed == None:
+            seed = self.random.getrandbits( 32 )
+        self.recordPress( 'n', seed )
+        self.random.seed( seed )
+        self.removeDepartedWagons()
+        self.ageWagons()
+        self.moveIndex = incrementIndex( self.moveIndex, len( self.moves ) )
+        if self.moveIndex == 0:
+            self.time = 0
+        self.nextMoveTime()
+        if self.moves.moveType( self.moveIndex ) == '+':
+            rake = self.rakes[ self.nextRake ]
+            self.selectOutgoing()
+            self.allocateWagons( rake )
+            rake[:] = []
+        self.record( 'n', seed )
+
+    def advance( self, count ):
+        # applies count moves in one go, with the clock going straight to the
+        # time of the last one rather than running up to each in turn. Like
+        # advanceTo it stops at the end of the timetable, only a single move
+        # goes on into the next day.
+        count = min( count, len( self.moves ) - 1 - self.moveIndex )
+        for idx in xrange( count ):
+            self.handleNextMoveButton()
+        if count > 0:
+            self.time = self.moveTime
+
+    def advanceTo( self, minutes ):
+        # applies the moves due by the given time, stopping at the end of
+        # the timetable
+        count = 0
+        times = self.moves.minutes
+        for idx in xrange( self.moveIndex + 1, len( times ) ):
+            if times[ idx ] >= 0:
+                if times[ idx ] > minutes:
+                    break
+                count = idx - self.moveIndex
+        self.advance( count )
+
+    def selectedWagon( self ):
+        wagon = None
+        if len( self.selection ) > 0:
+            rake = self.rakes[ self.selection[0] ]
+            wagon = rake[ self.selection[1] ]
+        return wagon
+
+    def handleWagonSelectButton( self ):
+        self.recordPress( 's' )
+        currentWagon = self.selectedWagon()
+        if currentWagon != None \
+        and currentWagon.wagonType == len( self.wagonTypes ) - 1:
+            # recorded once made, as recording may snapshot the state
+            selection = self.journalledSelection()
+            self.rakes[ self.selection[0] ].remove( currentWagon )
+            self.selection = ()
+            self.record( 'd', *selection )
+        else:
+            if len( self.selection ) == 0:
+                self.selection = ( 0, 0 )
+            else:
+                rake = self.rakes[ self.selection[0] ]
+                if self.selection[1] < len( rake ) - 1:
+                    self.selection = (  self.selection[0],
+                                        self.selection[1] + 1 )
+                else:
+                    if self.selection[0] < len( self.rakes ) - 1:
+                        self.selection = (  self.selection[0] + 1,
+                                            0 )
+                    else:
+                        self.selection = ()
+
+    def handleWagonChangeButton( self ):
+        self.recordPress( 'c' )
+        wagon = self.selectedWagon()
+        if wagon != None:
+            wagon.wagonType = incrementIndex(
+                                wagon.wagonType,
+                                len( self.wagonTypes ) )
+            self.record( 'c', *self.journalledSelection() )
+
+class SessionTotals:
+    # totals over the sessions given to runSession, which calls the methods
+    # below as it goes, so that other reports can add their own
+    def __init__( self, sidings ):
+        self.sessions = 0
+        self.overflows = [ 0 ] * sidings
+        self.maxOccupancy = [ 0 ] * sidings
+        self.starvedRakes = 0
+
+    def beforeMove( self, sim ):
+        pass
+
+    def afterMove( self, sim ):
+        for idx in range( len( sim.sidings ) ):
+            self.maxOccupancy[ idx ] = max(
+                                        self.maxOccupancy[ idx ],
+                                        len( sim.sidings[ idx ].wagons ) )
+
+    def endSession( self, sim ):
+        for idx in range( len( sim.sidings ) ):
+            self.overflows[ idx ] = self.overflows[ idx ] \
+                                    + sim.sidings[ idx ].overflows
+        self.starvedRakes = self.starvedRakes + sim.starvedRakes
+        self.sessions = self.sessions + 1
+
+    def add( self, other ):
+        self.sessions = self.sessions + other.sessions
+        for idx in range( len( self.overflows ) ):
+            self.overflows[ idx ] = self.overflows[ idx ] \
+                                    + other.overflows[ idx ]
+            self.maxOccupancy[ idx ] = max( self.maxOccupancy[ idx ],
+                                            other.maxOccupancy[ idx ] )
+        self.starvedRakes = self.starvedRakes + other.starvedRakes
+
+def runSession( sim, totals ):
+    # one session is a full operating day, i.e. every move in the WTT
+    for step in xrange( len( sim.moves ) ):
+        totals.beforeMove( sim )
+        sim.handleNextMoveButton()
+        totals.afterMove( sim )
+    totals.endSession( sim )
+
+def runSessions( baseName, sessions, seed=None, useState=False ):
+    template = Simulation( baseName, seed, useState )
+    seeds = random.Random( seed )
+    totals = SessionTotals( len( template.sidings ) )
+    for session in range( sessions ):
+        runSession( template.copy( seeds.getrandbits( 32 ) ), totals )
+    return ( template, totals )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run stationmaster sessions without a display' )
+    parser.add_argument( 'baseName' )
+    parser.add_argument( '-n', '--sessions', type=int, default=1000 )
+    parser.add_argument( '-s', '--seed', type=int, default=None )
+    parser.add_argument( '--use-state', action='store_true',
+        help='start each session from the saved state, not the config' )
+    args = parser.parse_args()
+
+    (template,totals) = runSessions(
+        args.baseName,
+        args.sessions,
+        args.seed,
+        args.use_state )
+
+    print( "{} sessions of {} moves".format(
+        totals.sessions, len( template.moves ) ) )
+    for idx in range( len( template.sidings ) ):
+        siding = template.sidings[ idx ]
+        print( "siding {}: length {}, max occupancy {}, overflows {}".format(
+            idx,
+            siding.length,
+            totals.maxOccupancy[ idx ],
+            totals.overflows[ idx ] ) )
+    print( "starved rakes: {}".format( totals.starvedRakes ) )
+
+if __name__ == '__main__':
+    main()
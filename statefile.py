@@ -0,0 +1,343 @@
+#!/usr/bin/python
+
+# Reading and writing of the .config and .state files, in either the
+# original text format or a versioned binary one. Wagons are kept as
+# columns of types, ages and outgoing flags, so the binary format can be
+# loaded with a handful of bulk array reads whatever the size of the layout.
+#
+# The binary format is little endian:
+#   header:     magic "SMB\0", version (uint16), kind (uint16)
+#   config:     train length (int32), wagon type count (uint32), then per
+#               type its length (float64), name length (uint16) and name,
+#               then the rakes and the initial wagons as wagon groups
+#   state:      move index (int32), generation (uint32), then the sidings
+#               and the rakes as wagon groups
+#   groups:     group count (uint32), wagons per group (uint32 each), then
+#               every type (uint16), every age (int32) and every outgoing
+#               flag (uint8)
+
+import sys, struct, array, argparse
+
+
+MAGIC = 'SMB\0'
+VERSION = 1
+CONFIG = 1
+STATE = 2
+
+HEADER = struct.Struct( '<4sHH' )
+CONFIG_HEADER = struct.Struct( '<iI' )
+WAGON_TYPE = struct.Struct( '<dH' )
+STATE_HEADER = struct.Struct( '<iI' )
+COUNT = struct.Struct( '<I' )
+
+class FormatError( Exception ):
+    # the line number is None for a binary file
+    def __init__( self, fileName, lineNumber, message ):
+        if lineNumber != None:
+            text = "{}:{}: {}".format( fileName, lineNumber, message )
+        else:
+            text = "{}: {}".format( fileName, message )
+        Exception.__init__( self, text )
+        self.fileName = fileName
+        self.lineNumber = lineNumber
+
+class WagonColumns:
+    def __init__( self ):
+        self.types = array.array( 'H' )
+        self.ages = array.array( 'i' )
+        self.outgoing = array.array( 'B' )
+
+    def __len__( self ):
+        return len( self.types )
+
+    def append( self, wagonType, age, outgoing ):
+        self.types.append( wagonType )
+        self.ages.append( age )
+        self.outgoing.append( outgoing )
+
+    def rows( self ):
+        return zip( self.types, self.ages, self.outgoing )
+
+class Config:
+    def __init__( self ):
+        self.trainLength = 1
+        self.wagonTypes = None
+        self.rakes = []
+        self.initial = []
+
+class State:
+    def __init__( self ):
+        self.moveIndex = 0
+        self.generation = 0
+        self.sidings = []
+        self.rakes = []
+        self.binary = False
+
+def isBinary( f ):
+    magic = f.read( len( MAGIC ) )
+    f.seek( 0 )
+    return magic == MAGIC
+
+def readConfig( fileName ):
+    f = open( fileName, "rb" )
+    try:
+        if isBinary( f ):
+            config = readBinaryConfig( f )
+        else:
+            config = readTextConfig( f )
+    except ValueError as e:
+        raise FormatError( fileName, None, e )
+    finally:
+        f.close()
+    return config
+
+def readState( fileName ):
+    f = open( fileName, "rb" )
+    try:
+        if isBinary( f ):
+            state = readBinaryState( f )
+        else:
+            state = readTextState( f )
+    except ValueError as e:
+        raise FormatError( fileName, None, e )
+    finally:
+        f.close()
+    return state
+
+# text format
+
+def numberedLines( f ):
+    # yields the number, offset and stripped text of each line, reading a
+    # line at a time so a file takes no more memory than its longest line
+    lineNumber = 0
+    offset = 0
+    line = f.readline()
+    while line != "":
+        lineNumber = lineNumber + 1
+        yield ( lineNumber, offset, line.strip() )
+        offset = offset + len( line )
+        line = f.readline()
+
+def parseWagons( wagonStates ):
+    wagons = WagonColumns()
+    for wagonState in wagonStates:
+        fields = wagonState.split( ',' )
+        wagonType = int( fields[0] )
+        if len( fields ) > 1:
+            age = int( fields[1] )
+        else:
+            age = 0
+        if len( fields ) > 2:
+            outgoing = fields[2] == "True"
+        else:
+            outgoing = False
+        wagons.append( wagonType, age, outgoing )
+    return wagons
+
+def formatWagons( wagons ):
+    return "/".join( [  "{},{},{}".format( wagonType, age, bool( outgoing ) )
+                        for (wagonType,age,outgoing) in wagons.rows() ] )
+
+def readTextConfig( f ):
+    config = Config()
+    for (lineNumber,offset,line) in numberedLines( f ):
+        if line != "" and line[0] != '#':
+            fields = line.split( '/' )
+            try:
+                if fields[0] == 'n':
+                    config.trainLength = int( fields[1] )
+                elif fields[0] == 'w':
+                    config.wagonTypes = []
+                    for wagonDefn in fields[1:]:
+                        defn = wagonDefn.split( ',' )
+                        config.wagonTypes.append(
+                            ( defn[0], float( defn[1] ) ) )
+                elif fields[0] == 'r':
+                    config.rakes.append( parseWagons( fields[1:] ) )
+                elif fields[0] == 'i':
+                    config.initial.append( parseWagons( fields[1:] ) )
+            except ( ValueError, IndexError ) as e:
+                raise FormatError( f.name, lineNumber, e )
+    return config
+
+def writeTextConfig( config, f ):
+    f.write( "n/{}\n".format( config.trainLength ) )
+    if config.wagonTypes != None:
+        f.write( "w/" + "/".join( [ "{},{!r}".format( name, length )
+                    for (name,length) in config.wagonTypes ] ) + "\n" )
+    for rake in config.rakes:
+        f.write( "r/" + formatWagons( rake ) + "\n" )
+    for wagons in config.initial:
+        f.write( "i/" + formatWagons( wagons ) + "\n" )
+
+def readTextState( f ):
+    state = State()
+    for (lineNumber,offset,line) in numberedLines( f ):
+        fields = line.split( '/' )
+        try:
+            if fields[0] == 'm':
+                state.moveIndex = int( fields[1] )
+            elif fields[0] == 'g':
+                state.generation = int( fields[1] )
+            elif fields[0] == 'r' or fields[0] == 's':
+                if fields[1] != '':
+                    wagons = parseWagons( fields[1:] )
+                else:
+                    wagons = WagonColumns()
+                if fields[0] == 'r':
+                    state.rakes.append( wagons )
+                else:
+                    state.sidings.append( wagons )
+        except ( ValueError, IndexError ) as e:
+            raise FormatError( f.name, lineNumber, e )
+    return state
+
+def writeTextState( state, f ):
+    f.write( "m/{}\n".format( state.moveIndex ) )
+    f.write( "g/{}\n".format( state.generation ) )
+    for wagons in state.sidings:
+        f.write( "s/" + formatWagons( wagons ) + "\n" )
+    for rake in state.rakes:
+        f.write( "r/" + formatWagons( rake ) + "\n" )
+
+# binary format
+
+def readArray( f, typecode, count ):
+    values = array.array( typecode )
+    values.fromstring( f.read( count * values.itemsize ) )
+    if len( values ) != count:
+        raise ValueError( "truncated binary file" )
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def writeArray( f, values ):
+    if sys.byteorder == 'big':
+        values = array.array( values.typecode, values )
+        values.byteswap()
+    f.write( values.tostring() )
+
+def readStruct( f, fmt ):
+    data = f.read( fmt.size )
+    if len( data ) != fmt.size:
+        raise ValueError( "truncated binary file" )
+    return fmt.unpack( data )
+
+def readGroups( f ):
+    (count,) = readStruct( f, COUNT )
+    sizes = readArray( f, 'I', count )
+    total = sum( sizes )
+    types = readArray( f, 'H', total )
+    ages = readArray( f, 'i', total )
+    outgoing = readArray( f, 'B', total )
+    groups = []
+    start = 0
+    for size in sizes:
+        wagons = WagonColumns()
+        wagons.types = types[ start:start + size ]
+        wagons.ages = ages[ start:start + size ]
+        wagons.outgoing = outgoing[ start:start + size ]
+        groups.append( wagons )
+        start = start + size
+    return groups
+
+def writeGroups( f, groups ):
+    f.write( COUNT.pack( len( groups ) ) )
+    writeArray( f, array.array( 'I', [ len( wagons ) for wagons in groups ] ) )
+    for (column,typecode) in ( ( 'types', 'H' ),
+                               ( 'ages', 'i' ),
+                               ( 'outgoing', 'B' ) ):
+        values = array.array( typecode )
+        for wagons in groups:
+            values.extend( getattr( wagons, column ) )
+        writeArray( f, values )
+
+def readHeader( f, kind ):
+    (magic,version,fileKind) = readStruct( f, HEADER )
+    if version != VERSION:
+        raise ValueError( "unsupported binary version {}".format( version ) )
+    if fileKind != kind:
+        raise ValueError( "binary file holds the wrong kind of data" )
+
+def readBinaryConfig( f ):
+    readHeader( f, CONFIG )
+    config = Config()
+    (config.trainLength,typeCount) = readStruct( f, CONFIG_HEADER )
+    config.wagonTypes = []
+    for idx in range( typeCount ):
+        (length,nameLength) = readStruct( f, WAGON_TYPE )
+        config.wagonTypes.append( ( f.read( nameLength ), length ) )
+    config.rakes = readGroups( f )
+    config.initial = readGroups( f )
+    return config
+
+def writeBinaryConfig( config, f ):
+    f.write( HEADER.pack( MAGIC, VERSION, CONFIG ) )
+    wagonTypes = config.wagonTypes or []
+    f.write( CONFIG_HEADER.pack( config.trainLength, len( wagonTypes ) ) )
+    for (name,length) in wagonTypes:
+        f.write( WAGON_TYPE.pack( length, len( name ) ) )
+        f.write( name )
+    writeGroups( f, config.rakes )
+    writeGroups( f, config.initial )
+
+def readBinaryState( f ):
+    readHeader( f, STATE )
+    state = State()
+    state.binary = True
+    (state.moveIndex,state.generation) = readStruct( f, STATE_HEADER )
+    state.sidings = readGroups( f )
+    state.rakes = readGroups( f )
+    return state
+
+def writeBinaryState( state, f ):
+    f.write( HEADER.pack( MAGIC, VERSION, STATE ) )
+    f.write( STATE_HEADER.pack( state.moveIndex, state.generation ) )
+    writeGroups( f, state.sidings )
+    writeGroups( f, state.rakes )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert .config and .state files between the text and '
+                    'binary formats' )
+    parser.add_argument( 'format', choices=[ 'text', 'binary' ] )
+    parser.add_argument( 'input' )
+    parser.add_argument( 'output' )
+    args = parser.parse_args()
+
+    f = open( args.input, "rb" )
+    binary = isBinary( f )
+    if binary:
+        (magic,version,kind) = readStruct( f, HEADER )
+        f.seek( 0 )
+    elif args.input.endswith( ".config" ):
+        kind = CONFIG
+    else:
+        kind = STATE
+    if kind == CONFIG:
+        if binary:
+            data = readBinaryConfig( f )
+        else:
+            data = readTextConfig( f )
+    else:
+        if binary:
+            data = readBinaryState( f )
+        else:
+            data = readTextState( f )
+    f.close()
+
+    f = open( args.output, "wb" )
+    if kind == CONFIG:
+        if args.format == 'binary':
+            writeBinaryConfig( data, f )
+        else:
+            writeTextConfig( data, f )
+    else:
+        if args.format == 'binary':
+            writeBinaryState( data, f )
+        else:
+            writeTextState( data, f )
+    f.close()
+
+if __name__ == '__main__':
+    main()
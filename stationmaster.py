@@ -1,8 +1,19 @@
 #!/usr/bin/python
 
-import RPi.GPIO as GPIO
-import pygame, sys, random, math
+# taken first so the startup report includes the imports
+import time
+STARTED = time.time()
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # only the buttons need it, and the server does without them
+    GPIO = None
+import pygame, os, sys, math, collections, argparse, threading
 from pygame.locals import *
+from simulation import Simulation, parseTime
+from instrument import NullProfiler, Profiler, PHASES, HEADINGS
+from framebuffer import FramebufferOutput
 
 
 WHITE       = ( 255, 255, 255 )
@@ -18,25 +29,40 @@ DARKGRAY    = (  96,  96,  96 )
 
 BGCOLOUR = BLACK
 
+# layouts and the sizes below are in units of a board this size, and are
+# scaled to fit the screen
+DESIGN_WIDTH = 800
+DESIGN_HEIGHT = 480
+
 MAX_WAGON_WIDTH = 50
 WAGON_GAP = 5
 
+TEXT_CACHE_SIZE = 512
+
+# damage left in more rectangles than this is redrawn as their bounding box
+MAX_DAMAGE_RECTS = 16
+
+# right hand edges of the columns of the profile overlay, after the phase
+PROFILE_COLUMNS = [ 150, 210, 270, 330 ]
+
 #unused = int( 11 ) #blue
 EXIT_PIN = int( 15 ) #red
 WAGON_CHANGE_PIN = int( 16 ) #white
 WAGON_SELECT_PIN = int( 13 ) #yellow
 NEXT_MOVE_PIN = int( 22 ) #green
 
-TYPE = 0
-TIME = 1
-AM_PM = 2
-DESCRIPTION = 3
+BUTTON_EVENT = USEREVENT
+CLOCK_EVENT = USEREVENT + 1
+LONG_PRESS_EVENT = USEREVENT + 2
+
+# holding next move down fast-forwards this many moves a second, for as
+# long as it is seen held each time the button is sampled
+LONG_PRESS_MS = 1000
+FAST_FORWARD_MOVES = 10
+HOLD_SAMPLE_MS = 50
 
-def incrementIndex( currentValue, limit ):
-    newValue = currentValue + 1
-    if newValue >= limit:
-        newValue = 0
-    return newValue
+# how long a file that fails to load is reported for before exiting
+ERROR_DISPLAY_MS = 10000
 
 class Button:
     def __init__( self, pin, minRepeatMS ):
@@ -46,572 +72,870 @@ class Button:
         GPIO.setup( pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN )
         GPIO.add_event_detect(
             pin,
-            GPIO.RISING )
+            GPIO.RISING,
+            callback=self.edgeDetected )
+
+    def edgeDetected( self, pin ):
+        # called on the GPIO thread, so just hand the press to the main loop
+        pygame.event.post( pygame.event.Event( BUTTON_EVENT, pin=pin ) )
 
     def pressed( self ):
         pressed = False
-        if GPIO.input( self.pin ) or GPIO.event_detected( self.pin ):
-            now = pygame.time.get_ticks()
-            if now - self.lastPress > self.minRepeatMS:
-                self.lastPress = now
-                pressed = True
+        now = pygame.time.get_ticks()
+        if now - self.lastPress > self.minRepeatMS:
+            self.lastPress = now
+            pressed = True
         return pressed
 
-class WagonType:
-    def __init__( self, wagonDefn ):
-        fields = wagonDefn.split( ',' )
-        self.name = fields[0]
-        self.length = float( fields[1] )
-
-class Wagon:
-    def __init__( self, wagonState ):
-        fields = wagonState.split( ',' )
-        self.wagonType = int( fields[0] )
-        if len( fields ) > 1:
-            self.age = int( fields[1] )
-        else:
-            self.age = 0
-        if len( fields ) > 2:
-            self.outgoing = fields[2] == "True"
-        else:
-            self.outgoing = False
-        self.selected = False
-
-    def reset( self ):
-        self.age = 0
-        self.outgoing = False
-
-    def incrAge( self ):
-        incr = random.randint( 1, 5 )
-        self.age = self.age + incr
-
-    def markOutgoing( self ):
-        self.outgoing = True
-
-    def isOutgoing( self ):
-        return self.outgoing
-
-    def text( self, wagonTypes ):
-        if self.wagonType < len( wagonTypes ):
-            val = wagonTypes[ self.wagonType ].name
-        else:
-            val = '?'
-        return val
-
-    def length( self, wagonTypes ):
-        if self.wagonType < len( wagonTypes ):
-            val = wagonTypes[ self.wagonType ].length
-        else:
-            val = 1
-        return val
-
-    def width( self, baseWidth, wagonTypes ):
-        return self.length( wagonTypes ) * baseWidth
+    def held( self ):
+        return GPIO.input( self.pin )
+
+def mergeRects( rects ):
+    # overlapping rectangles are merged so nothing is redrawn twice, and if
+    # there are still too many they are replaced by their bounding box
+    merged = []
+    for rect in rects:
+        rect = Rect( rect )
+        idx = rect.collidelist( merged )
+        while idx >= 0:
+            rect.union_ip( merged.pop( idx ) )
+            idx = rect.collidelist( merged )
+        merged.append( rect )
+    if len( merged ) > MAX_DAMAGE_RECTS:
+        merged = [ merged[0].unionall( merged[1:] ) ]
+    return merged
+
+class TextCache:
+    # least recently used cache of rendered text and wrapped line layouts,
+    # keyed on tuples whose first element is the text
+    def __init__( self, size ):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get( self, key, make, *args ):
+        try:
+            value = self.entries.pop( key )
+        except KeyError:
+            value = make( *args )
+            if len( self.entries ) >= self.size:
+                self.entries.popitem( last=False )
+        self.entries[ key ] = value
+        return value
+
+    def invalidate( self, text ):
+        for key in [ key for key in self.entries if key[0] == text ]:
+            del self.entries[ key ]
+
+class DisplayOutput:
+    def update( self, surface, damage ):
+        pygame.display.update( damage )
+
+    def close( self ):
+        pass
+
+class RawOutput:
+    # writes each changed frame whole, as raw pixels in the surface's own
+    # format, straight from the surface's memory, e.g. into a pipe to a
+    # video encoder
+    def __init__( self, fileName ):
+        self.f = open( fileName, "wb" )
+
+    def update( self, surface, damage ):
+        # the view is written through its buffer interface, a memoryview of
+        # it crashes pygame 1.9 when released
+        view = surface.get_view( '0' )
+        self.f.write( view )
+        self.f.flush()
+
+    def close( self ):
+        self.f.close()
+
+class PNGOutput:
+    # keeps a PNG of the latest frame, replaced whole each time the frame
+    # changes so a reader never sees half of one
+    def __init__( self, fileName ):
+        self.fileName = fileName
+        self.tempName = os.path.splitext( fileName )[0] + ".tmp.png"
+
+    def update( self, surface, damage ):
+        pygame.image.save( surface, self.tempName )
+        os.rename( self.tempName, self.fileName )
+
+    def close( self ):
+        pass
+
+class Loader( threading.Thread ):
+    # builds the game on a background thread while the splash is shown,
+    # keeping any error to raise again on the main thread
+    def __init__( self, *args, **kwargs ):
+        threading.Thread.__init__( self )
+        self.daemon = True
+        self.args = args
+        self.kwargs = kwargs
+        self.game = None
+        self.error = None
+
+    def run( self ):
+        try:
+            self.game = Game( *self.args, **self.kwargs )
+        except Exception:
+            self.error = sys.exc_info()
+
+def drawSplash( surface, text, outputs ):
+    font = pygame.font.Font( 'freesansbold.ttf', 18 )
+    surface.fill( BGCOLOUR )
+    block = font.render( text, True, WHITE )
+    blockRect = block.get_rect()
+    blockRect.center = surface.get_rect().center
+    surface.blit( block, blockRect )
+    for output in outputs:
+        output.update( surface, [ surface.get_rect() ] )
+
+class Game( Simulation ):
+    def __init__( self, baseName, surface=None, profiler=None ):
+        if surface == None:
+            surface = pygame.display.set_mode( ( 0, 0 ), pygame.FULLSCREEN )
+            pygame.display.set_caption( 'Stationmaster' )
+        self.surface = surface
+        # the display is only updated when drawing to it, an off-screen
+        # board is only seen through the outputs added to it
+        self.outputs = []
+        if surface == pygame.display.get_surface():
+            self.outputs.append( DisplayOutput() )
+        self.textCache = TextCache( TEXT_CACHE_SIZE )
+        self.dirty = set()
+        self.heldSince = None
+        self.layoutBoard()
+        self.background = None
+        Simulation.__init__( self, baseName )
+        for siding in self.sidings:
+            self.layoutSiding( siding )
+        if profiler == None:
+            profiler = NullProfiler()
+        self.profiler = profiler
+        self.profiler.instrument( self )
+        self.profileChanged = False
+        if self.profiler.overlay:
+            self.profileFont = pygame.font.Font( 'freesansbold.ttf', 12 )
+            self.profileRect = Rect(
+                                self.width - PROFILE_COLUMNS[-1] - 8,
+                                0,
+                                PROFILE_COLUMNS[-1] + 8,
+                                ( len( PHASES ) + 1 )
+                                * self.profileFont.get_linesize() + 4 )
+        self.openJournal()
 
-    def state( self ):
-        return str( self.wagonType ) + ',' \
-            +  str( self.age ) + ',' \
-            +  str( self.outgoing )
+    def loadLayout( self, baseName ):
+        Simulation.loadLayout( self, baseName )
+        self.background = None
 
-    def draw( self, left, top, baseWidth, game ):
-        if self.age == 0:
-            colour = DARKGREEN
-        elif self.outgoing:
-            colour = DARKRED
-        else:
-            colour = DARKYELLOW
-        top = top - game.wagonFont.get_linesize()
-        height = game.wagonFont.get_linesize() + game.wagonFont.get_height()
-        text = self.text( game.wagonTypes )
-        width = self.width( baseWidth, game.wagonTypes )
-        pygame.draw.rect(
-            game.surface,
-            colour,
-            Rect( left, top, width, height ),
-            1 )
-        if width < 0:
-            left = left + width
-            space = -WAGON_GAP
-        else:
-            space = width + WAGON_GAP
-        game.drawText(
-            text,
-            colour,
-            game.wagonFont,
-            left,
-            top,
-            math.fabs( width ) )
-        left = left + space
-        return left
-
-    def drawSpare( self, left, top, colour, game ):
-        text = self.text( game.wagonTypes )
-        (width, height) = game.wagonFont.size( text )
-        weight = 1
-        if game.selectedWagon() == self:
-            weight = 2
-        game.drawTextLine(
-            text,
-            colour,
-            game.wagonFont,
-            left,
-            top )
-        pygame.draw.rect(
-            game.surface,
-            colour,
-            Rect( left, top, width, height ),
-            weight )
-        return (width,height + 5)
+    def scaled( self, size ):
+        return int( round( size * self.scale ) )
 
-class Siding:
-    def __init__( self, length, wagonTypes, vertices, game ):
-        self.length = length
-        if wagonTypes != '':
-            self.wagonTypes = [ int( wt ) for wt in wagonTypes.split( ',' ) ]
-        else:
-            self.wagonTypes = []
-        self.vertices = [   game.parseVertex( vertex )
-                            for vertex in vertices.split( ';' ) ]
-        self.displayLength = math.fabs(
-                                self.vertices[-1][0]
-                                - self.vertices[0][0] )
-        self.wagons = []
-
-    def draw( self, game ):
-        pygame.draw.lines(
-            game.surface,
-            WHITE,
-            False,
-            self.vertices,
-            3 )
-        left = self.vertices[0][0]
-        top = self.vertices[0][1]
-        if self.length > 0:
-            wagonWidth = ( self.displayLength / self.length ) - WAGON_GAP
-            if wagonWidth > MAX_WAGON_WIDTH:
-                wagonWidth = MAX_WAGON_WIDTH
-            if left > self.vertices[1][0]:
+    def layoutBoard( self ):
+        # works out where everything goes on this screen once, so drawing
+        # only has to look it up
+        self.width = self.surface.get_width()
+        self.height = self.surface.get_height()
+        self.scale = min(   float( self.width ) / DESIGN_WIDTH,
+                            float( self.height ) / DESIGN_HEIGHT )
+        self.font = pygame.font.Font( 'freesansbold.ttf', self.scaled( 18 ) )
+        self.wagonFont = pygame.font.Font(
+                            'freesansbold.ttf',
+                            self.scaled( 16 ) )
+        self.clockRect = Rect( 0, 0, self.height / 3, self.height / 3 )
+        self.clockSize = ( self.height / 6 ) - self.scaled( 10 )
+        self.clockCenter = ( self.height / 6, self.height / 6 )
+        self.movesRect = Rect(
+                            self.height / 3,
+                            0,
+                            self.width - self.height / 3,
+                            self.height / 3 )
+        # the time, am/pm and description of the previous, current and next
+        # moves
+        self.moveSlots = [  (   self.height / 3,
+                                self.height / 3 + self.scaled( 40 ),
+                                self.height / 3 + self.scaled( 75 ),
+                                ( self.height / 9 ) * slot )
+                            for slot in range( 3 ) ]
+        self.sidingsTop = self.height / 3 + self.scaled( 10 )
+        self.rakesTop = self.height / 6 * 5
+        self.rakesRect = Rect(
+                            0,
+                            self.rakesTop + 1,
+                            self.width,
+                            self.height - self.rakesTop - 1 )
+        self.margin = self.scaled( 5 )
+        self.spacing = self.scaled( 10 )
+        self.wagonGap = self.scaled( WAGON_GAP )
+        self.wagonHeight = self.wagonFont.get_linesize() \
+                           + self.wagonFont.get_height()
+        self.trackWidth = max( 1, self.scaled( 3 ) )
+        # a row of the rake panel for each rake, laid out when its wagons
+        # change, and the first rake in view when the panel is scrolled
+        self.rakeRows = []
+        self.firstRake = 0
+
+    def layoutSiding( self, siding ):
+        # the width of each type of wagon on this siding, negative if the
+        # siding runs right to left
+        siding.displayLength = math.fabs(
+                                siding.vertices[-1][0]
+                                - siding.vertices[0][0] )
+        siding.wagonLeft = siding.vertices[0][0]
+        siding.wagonTop = siding.vertices[0][1] \
+                          - self.wagonFont.get_linesize()
+        siding.wagonWidth = 0
+        siding.typeWidths = []
+        if siding.length > 0:
+            wagonWidth = ( siding.displayLength / siding.length ) \
+                         - self.wagonGap
+            if wagonWidth > self.scaled( MAX_WAGON_WIDTH ):
+                wagonWidth = self.scaled( MAX_WAGON_WIDTH )
+            if siding.wagonLeft > siding.vertices[1][0]:
                 wagonWidth = -wagonWidth
-            for wagon in self.wagons:
-                left = wagon.draw( left, top, wagonWidth, game )
-
-    def ageWagons( self ):
-        [ wagon.incrAge() for wagon in self.wagons ]
-
-    def selectOutgoing( self, oldest, trainLength, wagonTypes ):
-        def sumLengths( lhs, rhs ):
-            return lhs + rhs.length( wagonTypes )
-
-        def removeYoungest( oldest ):
-            youngest = oldest[0]
-            for candidate in oldest:
-                if candidate.age < youngest.age:
-                    youngest = candidate
-            oldest.remove( youngest )
-
-        for wagon in self.wagons:
-            oldest.append( wagon )
-            while reduce( sumLengths, oldest, 0 ) > trainLength:
-                removeYoungest( oldest )
-
-    def transferOutgoing( self, rake ):
-        rake.extend( [ w for w in self.wagons if w.isOutgoing() ] )
-        self.wagons = [ w for w in self.wagons if not w.isOutgoing() ]
-
-    def accepts( self, wagon ):
-        return wagon.wagonType in self.wagonTypes
-
-    def save( self, f ):
-        f.write( "s/" )
-        f.write( "/".join( map( Wagon.state, self.wagons ) ) + "\n" )
-
-    def load( self, wagonStates ):
-        self.wagons = map( Wagon, wagonStates )
-
-class Game:
-    def __init__( self, baseName ):
-        self.baseName = baseName
-        self.clock = pygame.time.Clock()
-        self.moves = []
-        self.wagonTypes = []
-        self.rakes = []
-        self.nextRake = 0
-        self.selection = ()
-        self.sidings = []
-        self.trainLength = 1
+            siding.wagonWidth = wagonWidth
+            siding.typeWidths = [   wagonType.length * wagonWidth
+                                    for wagonType in self.wagonTypes ]
+        siding.drawnKey = None
+        siding.drawnRect = Rect( 0, 0, 0, 0 )
+
+    def createButtons( self ):
         self.nextMoveButton = Button( NEXT_MOVE_PIN, 1000 )
         self.wagonSelectButton = Button( WAGON_SELECT_PIN, 500 )
         self.wagonChangeButton = Button( WAGON_CHANGE_PIN, 500 )
         self.exitButton = Button( EXIT_PIN, 0 )
-        self.moveIndex = 0
-        self.moveTime = 0
-        self.time = 0
-        self.surface = pygame.display.set_mode( ( 0, 0 ), pygame.FULLSCREEN )
-        self.width = self.surface.get_width()
-        self.height = self.surface.get_height()
-        self.font = pygame.font.Font( 'freesansbold.ttf', 18 )
-        self.wagonFont = pygame.font.Font( 'freesansbold.ttf', 16 )
-        pygame.display.set_caption( 'Stationmaster' )
-        self.loadWTT( baseName )
-        self.loadLayout( baseName )
-        self.loadState( baseName )
-        self.nextMoveTime()
 
-    def parseVertex( self, vertex ):
-        coords = vertex.split( ',' )
-        return (    int( coords[0] ),
-                    int( coords[1] ) + self.height / 3 + 10 )
-
-    def loadWTT( self, baseName ):
-        f = open( baseName + ".wtt" )
-        self.moves = f.readlines()
-        f.close()
-
-    def loadLayout( self, baseName ):
-        f = open( baseName + ".layout" )
-        for line in f:
-            line = line.strip()
-            if line != "" and line[0] != '#':
-                (length,types,vertices) = line.split( '/' )
-                self.sidings.append(
-                    Siding( int( length ), types, vertices, self ) )
-        f.close()
-
-    def loadState( self, baseName ):
-        try:
-            state = open( baseName + ".state" )
-        except:
-            state = None
-
-        config = open( baseName + ".config" )
-        for line in config:
-            line = line.strip()
-            if line != "" and line[0] != '#':
-                fields = line.split( '/' )
-                if fields[0] == 'n':
-                    self.trainLength = int( fields[1] )
-                elif fields[0] == 'w':
-                    self.wagonTypes = map( WagonType, fields[1:] )
-                    self.wagonTypes.append( WagonType( ",0" ) )
-                elif state == None:
-                    if fields[0] == 'r':
-                        self.rakes.append(
-                            map( Wagon, fields[1:] ) )
-                    elif fields[0] == 'i':
-                        self.allocateWagons(
-                            map( Wagon, fields[1:] ) )
-        config.close()
-
-        if state != None:
-            sidingIter = self.sidings.__iter__()
-            for line in state:
-                line = line.strip()
-                fields = line.split( '/' )
-                if fields[0] == 'm':
-                    self.moveIndex = int( fields[1] )
-                elif fields[0] == 'r':
-                    if fields[1] != '':
-                        wagons = map( Wagon, fields[1:] )
-                    else:
-                        wagons = []
-                    self.rakes.append( wagons )
-                elif fields[0] == 's':
-                    siding = sidingIter.next()
-                    if fields[1] != '':
-                        siding.load( fields[1:] )
-            state.close()
+    def placeVertex( self, vertex ):
+        (x,y) = vertex
+        return ( self.scaled( x ), self.scaled( y ) + self.sidingsTop )
 
     def start( self ):
         self.fps = 5
         self.surface.fill( BGCOLOUR )
+        self.invalidate( 'all' )
 
-    def nextMoveTime( self ):
-        if self.moveIndex < len( self.moves ):
-            move = self.moves[ self.moveIndex ].strip()
-            if move != "":
-                fields = move.split( '/' )
-                time = fields[TIME]
-                am_pm = fields[AM_PM]
-                (hour,minute) = map( int, time.split( ':' ) )
-                if hour == 12:
-                    hour = 0
-                if am_pm == "pm":
-                    hour = hour + 12
-                self.moveTime = hour * 60 + minute
-            else:
-                self.moveTime = 0
-
-    def allocateWagons( self, train ):
-        for wagon in train:
-            allocated = False
-            possibilities = [ siding    for siding in self.sidings
-                                        if siding.accepts( wagon ) ]
-            while not allocated and len( possibilities ) > 0:
-                sIdx = random.randint( 0, len( possibilities ) - 1 )
-                siding = possibilities[ sIdx ]
-                if len( siding.wagons ) < siding.length:
-                    allocated = True
-                    siding.wagons.append( wagon )
-                else:
-                    possibilities.remove( siding )
-
-            if not allocated:
-                possibilities = [ siding    for siding in self.sidings
-                                            if siding.accepts( wagon ) ]
-                possibilities[0].wagons.append( wagon )
-
+    def invalidate( self, *regions ):
+        self.dirty.update( regions )
 
     def handleExitButton( self ):
-        f = open( self.baseName + ".state", "w" )
-        f.write( "m/{}\n".format( self.moveIndex ) )
-        [ siding.save( f ) for siding in self.sidings ]
-        nextRake = self.nextRake
-        allRakesWritten = False
-        while not allRakesWritten:
-            rake = self.rakes[ nextRake ]
-            f.write( "r/" )
-            f.write( "/".join( map( Wagon.state, rake ) ) + "\n"  )
-            nextRake = incrementIndex( nextRake, len( self.rakes ) )
-            allRakesWritten = nextRake == self.nextRake
-        f.close()
-
-    def selectOutgoing( self ):
-        oldest = []
-        [ siding.selectOutgoing( oldest, self.trainLength, self.wagonTypes )
-            for siding in self.sidings ]
-        [ wagon.markOutgoing() for wagon in oldest ]
-
-    def ageWagons( self ):
-        [ siding.ageWagons() for siding in self.sidings ]
-
-    def transferOutgoing( self, rake ):
-        [ siding.transferOutgoing( rake ) for siding in self.sidings ]
-        [ wagon.reset() for wagon in rake ]
-
-    def removeDepartedWagons( self ):
-        move = self.moves[ self.moveIndex ].strip()
-        if move != "":
-            moveType = move.split( '/' )[ TYPE ]
-            if moveType == '-':
-                rake = self.rakes[ self.nextRake ]
-                self.transferOutgoing( rake )
-                self.nextRake = incrementIndex(
-                                    self.nextRake,
-                                    len( self.rakes ) )
-
-    def handleNextMoveButton( self ):
-        self.removeDepartedWagons()
-        self.ageWagons()
-        self.moveIndex = incrementIndex( self.moveIndex, len( self.moves ) )
-        if self.moveIndex == 0:
-            self.time = 0
-        self.nextMoveTime()
-        move = self.moves[ self.moveIndex ].strip()
-        if move != "":
-            rake = self.rakes[ self.nextRake ]
-            moveType = move.split( '/' )[ TYPE ]
-            if moveType == '+':
-                self.selectOutgoing()
-                self.allocateWagons( rake )
-                rake[:] = []
-
-    def selectedWagon( self ):
-        wagon = None
-        if len( self.selection ) > 0:
-            rake = self.rakes[ self.selection[0] ]
-            wagon = rake[ self.selection[1] ]
-        return wagon
+        self.closeJournal()
+
+    def handleNextMoveButton( self, seed=None ):
+        Simulation.handleNextMoveButton( self, seed )
+        self.invalidate( 'clock', 'moves', 'sidings', 'rakes' )
 
     def handleWagonSelectButton( self ):
-        currentWagon = self.selectedWagon()
-        if currentWagon != None \
-        and currentWagon.wagonType == len( self.wagonTypes ) - 1:
-            self.rakes[ self.selection[0] ].remove( currentWagon )
-            self.selection = ()
-        else:
-            if len( self.selection ) == 0:
-                self.selection = ( 0, 0 )
-            else:
-                rake = self.rakes[ self.selection[0] ]
-                if self.selection[1] < len( rake ) - 1:
-                    self.selection = (  self.selection[0],
-                                        self.selection[1] + 1 )
-                else:
-                    if self.selection[0] < len( self.rakes ) - 1:
-                        self.selection = (  self.selection[0] + 1,
-                                            0 )
-                    else:
-                        self.selection = ()
+        Simulation.handleWagonSelectButton( self )
+        self.invalidate( 'rakes' )
 
     def handleWagonChangeButton( self ):
         wagon = self.selectedWagon()
         if wagon != None:
-            wagon.wagonType = incrementIndex(
-                                wagon.wagonType,
-                                len( self.wagonTypes ) )
+            self.textCache.invalidate( wagon.text( self.wagonTypes ) )
+        Simulation.handleWagonChangeButton( self )
+        self.invalidate( 'rakes' )
 
-    def drawClock( self, moveIndex ):
-        clockSize = ( self.height / 6 ) - 10
-        clockCenter = ( self.height / 6, self.height / 6 )
-        clockTime = self.time % 720
-        hourRad = float( clockTime ) / 360  * math.pi
-        minRad = float( clockTime % 60 ) / 30 * math.pi
-        hourHandLength = clockSize - 30
-        minHandLength = clockSize - 15
-        hourPos = (
-            clockCenter[0] + math.sin( hourRad ) * hourHandLength,
-            clockCenter[1] - math.cos( hourRad ) * hourHandLength )
-        minPos = (
-            clockCenter[0] + math.sin( minRad ) * minHandLength,
-            clockCenter[1] - math.cos( minRad ) * minHandLength )
+    def wagonColour( self, wagon ):
+        if wagon.age == 0:
+            colour = DARKGREEN
+        elif wagon.outgoing:
+            colour = DARKRED
+        else:
+            colour = DARKYELLOW
+        return colour
+
+    def sidingWagons( self, siding ):
+        # yields each wagon with its box and text position, as drawn
+        left = siding.wagonLeft
+        top = siding.wagonTop
+        widths = siding.typeWidths
+        if siding.length > 0:
+            for wagon in siding.wagons:
+                if wagon.wagonType < len( widths ):
+                    width = widths[ wagon.wagonType ]
+                else:
+                    width = siding.wagonWidth
+                box = Rect( left, top, width, self.wagonHeight )
+                if width < 0:
+                    left = left + width
+                    space = -self.wagonGap
+                else:
+                    space = width + self.wagonGap
+                yield ( wagon, box, left, top, math.fabs( width ) )
+                left = left + space
+
+    def sidingKey( self, siding ):
+        wagons = siding.wagons
+        return (    wagons.types.tostring(),
+                    [ age == 0 for age in wagons.ages ],
+                    wagons.outgoing.tostring() )
+
+    def sidingExtent( self, siding ):
+        xs = [ vertex[0] for vertex in siding.vertices ]
+        ys = [ vertex[1] for vertex in siding.vertices ]
+        extent = Rect( min( xs ), min( ys ), 1, 1 )
+        extent.union_ip( Rect( max( xs ), max( ys ), 1, 1 ) )
+        extent.inflate_ip(
+            self.trackWidth + self.margin,
+            self.trackWidth + self.margin )
+        for (wagon,box,left,top,width) in self.sidingWagons( siding ):
+            box = Rect( box )
+            box.normalize()
+            extent.union_ip( box.inflate( 2, 2 ) )
+            extent.union_ip( self.textExtent(
+                wagon.text( self.wagonTypes ),
+                self.wagonFont,
+                left,
+                top,
+                width ) )
+        return extent
+
+    def drawTrack( self, surface, siding ):
+        pygame.draw.lines(
+            surface,
+            WHITE,
+            False,
+            siding.vertices,
+            self.trackWidth )
 
-        pygame.draw.circle(
+    def drawSiding( self, siding ):
+        for (wagon,box,left,top,width) in self.sidingWagons( siding ):
+            colour = self.wagonColour( wagon )
+            pygame.draw.rect(
+                self.surface,
+                colour,
+                box,
+                1 )
+            self.drawText(
+                wagon.text( self.wagonTypes ),
+                colour,
+                self.wagonFont,
+                left,
+                top,
+                width )
+
+    def drawSpare( self, text, box, colour, weight ):
+        self.drawTextLine(
+            text,
+            colour,
+            self.wagonFont,
+            box.left,
+            box.top )
+        pygame.draw.rect(
             self.surface,
+            colour,
+            box,
+            weight )
+
+    def drawClockFace( self, surface ):
+        clockSize = self.clockSize
+        clockCenter = self.clockCenter
+        pygame.draw.circle(
+            surface,
             WHITE,
             clockCenter,
             clockSize )
         pygame.draw.circle(
-            self.surface,
+            surface,
             BLACK,
             clockCenter,
-            clockSize - 2,
-            2 )
+            clockSize - self.scaled( 2 ),
+            self.scaled( 2 ) )
         for h in range( 12 ):
             dotRad = float( h ) / 6 * math.pi
-            dotRadius = clockSize - 5
+            dotRadius = clockSize - self.scaled( 5 )
             dotPos = (
                         int( clockCenter[0] + math.sin( dotRad ) * dotRadius ),
                         int( clockCenter[1] - math.cos( dotRad ) * dotRadius ) )
             pygame.draw.circle(
-                self.surface,
+                surface,
                 BLACK,
                 dotPos,
-                4 )
+                self.scaled( 4 ) )
+
+    def drawClock( self, moveIndex ):
+        clockCenter = self.clockCenter
+        clockTime = self.time % 720
+        hourRad = float( clockTime ) / 360  * math.pi
+        minRad = float( clockTime % 60 ) / 30 * math.pi
+        hourHandLength = self.clockSize - self.scaled( 30 )
+        minHandLength = self.clockSize - self.scaled( 15 )
+        hourPos = (
+            clockCenter[0] + math.sin( hourRad ) * hourHandLength,
+            clockCenter[1] - math.cos( hourRad ) * hourHandLength )
+        minPos = (
+            clockCenter[0] + math.sin( minRad ) * minHandLength,
+            clockCenter[1] - math.cos( minRad ) * minHandLength )
 
         pygame.draw.line(
             self.surface,
             BLACK,
             clockCenter,
             hourPos,
-            4 )
+            self.scaled( 4 ) )
         pygame.draw.line(
             self.surface,
             BLACK,
             clockCenter,
             minPos )
 
+    def renderText( self, text, colour, font ):
+        return self.textCache.get(
+                    ( text, font, colour ),
+                    font.render,
+                    text,
+                    True,
+                    colour )
+
+    def textSize( self, text, font ):
+        return self.textCache.get( ( text, font ), font.size, text )
+
     def drawTextLine( self, text, colour, font, left, top ):
-        block = font.render( text, True, colour )
+        block = self.renderText( text, colour, font )
         blockRect = block.get_rect()
         blockRect.topleft = ( left, top )
         self.surface.blit( block, blockRect )
 
-    def drawText( self, text, colour, font, left, top, maxWidth ):
-        words = text.split()
+    def wrapText( self, text, font, maxWidth ):
+        lines = []
         line = ""
-        for idx in range( 0, len( words ) ):
-            test = line + ' ' + words[ idx ]
+        for word in text.split():
+            test = line + ' ' + word
             (width, height) = font.size( test )
-            if left + width > maxWidth:
+            if width > maxWidth:
                 if line != "":
-                    self.drawTextLine( line, colour, font, left, top )
-                    line = ' ' + words[ idx ]
+                    lines.append( line )
+                    line = ' ' + word
                 else:
-                    self.drawTextLine( words[ idx ], colour, font, left, top )
-                top = top + font.get_linesize()
+                    lines.append( word )
             else:
                 line = test
         if line != "":
+            lines.append( line )
+        return [ ( line, font.size( line )[0] ) for line in lines ]
+
+    def wrappedLines( self, text, font, left, maxWidth ):
+        # wrapping only depends on the width left over, and any width left
+        # below zero wraps after every word
+        width = max( maxWidth - left, 0 )
+        return self.textCache.get(
+                    ( text, font, None, width ),
+                    self.wrapText,
+                    text,
+                    font,
+                    width )
+
+    def textExtent( self, text, font, left, top, maxWidth ):
+        lines = self.wrappedLines( text, font, left, maxWidth )
+        width = 0
+        for (line,lineWidth) in lines:
+            width = max( width, lineWidth )
+        return Rect( left, top, width, len( lines ) * font.get_linesize() )
+
+    def drawText( self, text, colour, font, left, top, maxWidth ):
+        for (line,width) in self.wrappedLines( text, font, left, maxWidth ):
             self.drawTextLine( line, colour, font, left, top )
+            top = top + font.get_linesize()
 
     def drawMove( self, moveIndex, colour, slot ):
-        move = self.moves[ moveIndex ].strip()
-        if move != "":
-            (newCards,time,ampm,description) = move.split( '/' )
+        move = self.moves[ moveIndex ]
+        if move != None:
+            (timeLeft,amPmLeft,descriptionLeft,top) = self.moveSlots[ slot ]
             self.drawTextLine(
-                time,
+                move.clockTime,
                 colour,
                 self.font,
-                self.height / 3,
-                ( self.height / 9 ) * slot )
+                timeLeft,
+                top )
             self.drawTextLine(
-                ampm,
+                move.amPm,
                 colour,
                 self.font,
-                self.height / 3 + 40,
-                ( self.height / 9 ) * slot )
+                amPmLeft,
+                top )
             self.drawText(
-                description,
+                move.description,
                 colour,
                 self.font,
-                self.height / 3 + 75,
-                ( self.height / 9 ) * slot,
+                descriptionLeft,
+                top,
                 self.width )
 
-    def drawRakes( self, top ):
-        for rake in self.rakes:
-            height = self.wagonFont.get_linesize()
-            left = 10
-            for wagon in rake:
-                if rake == self.rakes[ self.nextRake ]:
-                    colour = LIGHTYELLOW
-                else:
-                    colour = DARKGRAY
-                (width,height) = wagon.drawSpare( left, top, colour, self )
-                left = left + width + 10
-            top = top + height + 10
+    def layoutRake( self, rake ):
+        # the key the layout was made for, the height of the row and the
+        # text and box of each wagon, with the box relative to the row
+        key = tuple( [ wagon.wagonType for wagon in rake ] )
+        height = self.wagonFont.get_linesize()
+        left = self.spacing
+        spares = []
+        for wagon in rake:
+            text = wagon.text( self.wagonTypes )
+            (width,height) = self.textSize( text, self.wagonFont )
+            spares.append( ( text, Rect( left, 0, width, height ) ) )
+            left = left + width + self.spacing
+            height = height + self.margin
+        return ( key, height, spares )
+
+    def rakeRow( self, idx ):
+        rake = self.rakes[ idx ]
+        while len( self.rakeRows ) <= idx:
+            self.rakeRows.append( None )
+        row = self.rakeRows[ idx ]
+        if row == None \
+           or row[0] != tuple( [ wagon.wagonType for wagon in rake ] ):
+            row = self.layoutRake( rake )
+            self.rakeRows[ idx ] = row
+        return row
+
+    def rakesFit( self, first, last, top ):
+        for idx in xrange( first, last + 1 ):
+            top = top + self.rakeRow( idx )[1] + self.spacing
+        return top - self.spacing <= self.height
+
+    def scrolledTo( self, first, last, top ):
+        # the first rake in view once scrolled down far enough to show last
+        while first < last and not self.rakesFit( first, last, top ):
+            first = first + 1
+        return first
+
+    def scrollRakes( self, top ):
+        # scrolls as little as possible to bring the rake of the selected
+        # wagon into view, then the next rake to leave if it fits alongside
+        if len( self.selection ) > 0:
+            keep = self.selection[0]
+        else:
+            keep = self.nextRake
+        self.firstRake = self.scrolledTo(
+                            min( self.firstRake, keep ),
+                            keep,
+                            top )
+        if self.nextRake < self.firstRake:
+            if self.rakesFit( self.nextRake, keep, top ):
+                self.firstRake = self.nextRake
+        elif self.nextRake > keep:
+            first = self.scrolledTo( self.firstRake, self.nextRake, top )
+            if first <= keep:
+                self.firstRake = first
 
-    def drawBoard( self ):
-        left = 0
-        self.surface.fill( BGCOLOUR )
-        self.drawClock( self.moveIndex )
+    def drawRakes( self, top ):
+        # only the rows in the panel are drawn, the rakes above and below
+        # them are scrolled out of view
+        self.scrollRakes( top )
+        del self.rakeRows[ len( self.rakes ): ]
+        idx = self.firstRake
+        while idx < len( self.rakes ) and top < self.height:
+            (key,height,spares) = self.rakeRow( idx )
+            if idx == self.nextRake:
+                colour = LIGHTYELLOW
+            else:
+                colour = DARKGRAY
+            for wagonIdx in range( len( spares ) ):
+                (text,box) = spares[ wagonIdx ]
+                weight = 1
+                if self.selection == ( idx, wagonIdx ):
+                    weight = 2
+                self.drawSpare( text, box.move( 0, top ), colour, weight )
+            top = top + height + self.spacing
+            idx = idx + 1
+
+    def drawMoves( self ):
         if self.moveIndex > 0:
             self.drawMove( self.moveIndex - 1, DARKGRAY, 0 )
         self.drawMove( self.moveIndex, WHITE, 1 )
         if ( self.moveIndex + 1 ) < len( self.moves ):
             self.drawMove( self.moveIndex + 1, DARKGRAY, 2 )
+
+    def drawDivider( self, surface, top ):
         pygame.draw.line(
-            self.surface,
+            surface,
             WHITE,
-            ( 5, self.height / 3 ),
-            ( self.width - 5, self.height / 3 ) )
-        [ siding.draw( self ) for siding in self.sidings ]
-        top = self.height / 6 * 5
-        pygame.draw.line(
-            self.surface,
-            WHITE,
-            ( 5, top ),
-            ( self.width - 5, top ) )
-        self.drawRakes( top + 10 )
+            ( self.margin, top ),
+            ( self.width - self.margin, top ) )
+
+    def drawBackground( self ):
+        # the parts of the board that never change, drawn once and copied
+        # into each damaged rectangle in place of clearing it
+        background = pygame.Surface( self.surface.get_size(), 0, self.surface )
+        background.fill( BGCOLOUR )
+        self.drawClockFace( background )
+        self.drawDivider( background, self.height / 3 )
+        # every track is now under every siding's wagons. Each siding used
+        # to be drawn track then wagons in turn, so where sidings cross, a
+        # later siding's track was drawn over an earlier one's wagons.
+        for siding in self.sidings:
+            self.drawTrack( background, siding )
+        self.drawDivider( background, self.rakesTop )
+        self.background = background
+
+    def damagedRects( self ):
+        damage = []
+        if 'all' in self.dirty:
+            for siding in self.sidings:
+                siding.drawnKey = self.sidingKey( siding )
+                siding.drawnRect = self.sidingExtent( siding )
+            damage.append( self.surface.get_rect() )
+        else:
+            if 'clock' in self.dirty:
+                damage.append( self.clockRect )
+            if 'moves' in self.dirty:
+                damage.append( self.movesRect )
+            if 'sidings' in self.dirty:
+                for siding in self.sidings:
+                    key = self.sidingKey( siding )
+                    if key != siding.drawnKey:
+                        extent = self.sidingExtent( siding )
+                        damage.append( extent.union( siding.drawnRect ) )
+                        siding.drawnKey = key
+                        siding.drawnRect = extent
+            if 'rakes' in self.dirty:
+                damage.append( self.rakesRect )
+        self.dirty.clear()
+        # each siding in an overlapping rectangle is drawn once per
+        # rectangle, so on a layout of many crossing sidings the damage of a
+        # move took time quadratic in the sidings until it was merged
+        return mergeRects( damage )
 
-    def runGame( self ):
+    def drawBoard( self ):
+        # redraws only the damaged parts of the board, each one clipped to
+        # its rectangle, and returns the rectangles for display.update
+        if self.background == None \
+           or self.background.get_size() != self.surface.get_size():
+            self.drawBackground()
+        damage = self.damagedRects()
+        for rect in damage:
+            self.surface.set_clip( rect )
+            self.surface.blit( self.background, rect, rect )
+            if rect.colliderect( self.clockRect ):
+                self.drawClock( self.moveIndex )
+            if rect.colliderect( self.movesRect ):
+                self.surface.set_clip( rect.clip( self.movesRect ) )
+                self.drawMoves()
+                self.surface.set_clip( rect )
+            for siding in self.sidings:
+                if rect.colliderect( siding.drawnRect ):
+                    self.drawSiding( siding )
+            if rect.colliderect( self.rakesRect ):
+                self.drawRakes( self.rakesTop + self.spacing )
+        self.surface.set_clip( None )
+        return damage
+
+    def drawProfile( self, damage ):
+        # the overlay sits on top of the board, so it is redrawn whenever
+        # the board under it is, as well as when the timings change
+        if self.profileChanged or self.profileRect.collidelist( damage ) >= 0:
+            self.surface.fill( BGCOLOUR, self.profileRect )
+            pygame.draw.rect( self.surface, DARKGRAY, self.profileRect, 1 )
+            top = self.profileRect.top + 2
+            for row in [ HEADINGS ] + self.profiler.summary:
+                block = self.profileFont.render( row[0], True, WHITE )
+                self.surface.blit( block, ( self.profileRect.left + 4, top ) )
+                for (field,right) in zip( row[1:], PROFILE_COLUMNS ):
+                    block = self.profileFont.render( field, True, WHITE )
+                    self.surface.blit(
+                        block,
+                        ( self.profileRect.left + right - block.get_width(),
+                          top ) )
+                top = top + self.profileFont.get_linesize()
+            damage = mergeRects( damage + [ self.profileRect ] )
+        return damage
+
+    def updateClockTimer( self ):
+        running = self.time < self.moveTime
+        if running != self.clockRunning:
+            if running:
+                pygame.time.set_timer( CLOCK_EVENT, 1000 / self.fps )
+            else:
+                pygame.time.set_timer( CLOCK_EVENT, 0 )
+            self.clockRunning = running
+
+    def handleButton( self, pin ):
         done = False
-        while not done:
+        if pin == self.exitButton.pin:
             if self.exitButton.pressed():
                 self.handleExitButton()
                 done = True
-            elif self.nextMoveButton.pressed():
+        elif pin == self.nextMoveButton.pin:
+            if self.nextMoveButton.pressed():
                 self.handleNextMoveButton()
-            elif self.wagonSelectButton.pressed():
+                self.heldSince = pygame.time.get_ticks()
+                pygame.time.set_timer( LONG_PRESS_EVENT, HOLD_SAMPLE_MS )
+        elif pin == self.wagonSelectButton.pin:
+            if self.wagonSelectButton.pressed():
                 self.handleWagonSelectButton()
-            elif self.wagonChangeButton.pressed():
+        elif pin == self.wagonChangeButton.pin:
+            if self.wagonChangeButton.pressed():
                 self.handleWagonChangeButton()
+        return done
+
+    def handleLongPress( self ):
+        # while next move is held down the moves are applied a batch at a
+        # time, and the board is only drawn after each batch. A release seen
+        # by any sample ends the hold, so a second press that the debounce
+        # drops cannot pass for the first one still being held.
+        if self.heldSince != None and self.nextMoveButton.held():
+            now = pygame.time.get_ticks()
+            if now - self.heldSince >= LONG_PRESS_MS:
+                self.advance( FAST_FORWARD_MOVES )
+                self.heldSince = now
+        else:
+            self.heldSince = None
+            pygame.time.set_timer( LONG_PRESS_EVENT, 0 )
 
-            if self.time < self.moveTime:
-                self.time = self.time + 1
-            self.drawBoard()
-            pygame.display.update()
-            self.clock.tick( self.fps )
+    def updateOutputs( self, damage ):
+        for output in self.outputs:
+            output.update( self.surface, damage )
+
+    def closeOutputs( self ):
+        for output in self.outputs:
+            output.close()
+
+    def runGame( self ):
+        # sleeps in event.wait until a button edge, a clock tick while the
+        # clock is catching up with the next move, or an expose arrives
+        pygame.event.set_blocked( None )
+        pygame.event.set_allowed(
+            [ VIDEOEXPOSE, BUTTON_EVENT, CLOCK_EVENT, LONG_PRESS_EVENT ] )
+        self.clockRunning = False
+        done = False
+        while not done:
+            self.updateClockTimer()
+            damage = self.drawBoard()
+            if self.profiler.overlay:
+                damage = self.drawProfile( damage )
+            if len( damage ) > 0:
+                self.profiler.start( 'update' )
+                self.updateOutputs( damage )
+                self.profiler.stop( 'update' )
+
+            self.profiler.start( 'wait' )
+            events = [ pygame.event.wait() ] + pygame.event.get()
+            self.profiler.stop( 'wait' )
+            self.profiler.start( 'events' )
+            for event in events:
+                if done:
+                    break
+                elif event.type == BUTTON_EVENT:
+                    done = self.handleButton( event.pin )
+                elif event.type == CLOCK_EVENT:
+                    if self.time < self.moveTime:
+                        self.time = self.time + 1
+                        self.invalidate( 'clock' )
+                elif event.type == LONG_PRESS_EVENT:
+                    self.handleLongPress()
+                elif event.type == VIDEOEXPOSE:
+                    self.invalidate( 'all' )
+            self.profiler.stop( 'events' )
+            self.profileChanged = self.profiler.endFrame()
+        pygame.time.set_timer( CLOCK_EVENT, 0 )
+        pygame.time.set_timer( LONG_PRESS_EVENT, 0 )
 
 def main():
+    parser = argparse.ArgumentParser( description='Run a stationmaster session' )
+    parser.add_argument( 'baseName',
+        help='layout to run, the path of its files without the extension' )
+    parser.add_argument( '--profile', action='store_true',
+        help='show frame and move timings over the board' )
+    parser.add_argument( '--profile-log', metavar='FILE',
+        help='log frame and move timings to a rolling file' )
+    parser.add_argument( '--advance', type=int, default=0, metavar='MOVES',
+        help='apply this many moves before showing the board, stopping at '
+             'the end of the timetable' )
+    parser.add_argument( '--advance-to', nargs=2, metavar=( 'TIME', 'AM_PM' ),
+        help='apply the moves due by this time, e.g. 3:15 pm' )
+    parser.add_argument( '--size', nargs=2, type=int,
+        metavar=( 'WIDTH', 'HEIGHT' ),
+        help='draw in a window this size rather than full screen, which '
+             'with SDL_VIDEODRIVER=dummy is off-screen' )
+    parser.add_argument( '--export-raw', metavar='FILE',
+        help='write each changed frame to FILE as raw pixels' )
+    parser.add_argument( '--export-png', metavar='FILE',
+        help='keep FILE a PNG of the latest frame' )
+    parser.add_argument( '--record', metavar='FILE',
+        help='record the button presses to FILE, for replay.py' )
+    parser.add_argument( '--framebuffer', metavar='DEVICE',
+        help='draw straight to a framebuffer device such as /dev/fb0 '
+             'rather than through SDL, or to a file standing in for one' )
+    parser.add_argument( '--framebuffer-depth', type=int, default=16,
+        choices=[ 16, 32 ],
+        help='bits a pixel when the framebuffer is a plain file' )
+    args = parser.parse_args()
+    advanceTo = None
+    if args.advance_to != None:
+        try:
+            advanceTo = parseTime( *args.advance_to )
+        except ValueError as e:
+            parser.error( str( e ) )
+
+    if GPIO == None:
+        parser.error( "RPi.GPIO is needed for the buttons" )
+
+    profiler = None
+    if args.profile or args.profile_log != None:
+        profiler = Profiler( args.profile_log, args.profile )
+
     GPIO.setmode( GPIO.BOARD )
 
+    framebuffer = None
+    if args.framebuffer != None:
+        # SDL is only used for the events, it must leave the console alone
+        os.environ[ 'SDL_VIDEODRIVER' ] = 'dummy'
     pygame.init()
-    pygame.mouse.set_visible( False )
-
-    game = Game( sys.argv[1] )
+    if args.framebuffer != None:
+        framebuffer = FramebufferOutput(
+                        args.framebuffer,
+                        args.size,
+                        args.framebuffer_depth )
+        surface = framebuffer.createSurface()
+        splashOutputs = [ framebuffer ]
+    else:
+        if args.size != None:
+            surface = pygame.display.set_mode( args.size, 0, 32 )
+        else:
+            surface = pygame.display.set_mode( ( 0, 0 ), pygame.FULLSCREEN )
+        pygame.display.set_caption( 'Stationmaster' )
+        pygame.mouse.set_visible( False )
+        splashOutputs = [ DisplayOutput() ]
+    drawSplash( surface, 'Stationmaster', splashOutputs )
+    splashTime = time.time() - STARTED
+
+    loader = Loader( args.baseName, surface, profiler )
+    loader.start()
+    while loader.is_alive():
+        pygame.event.pump()
+        loader.join( 0.05 )
+    if loader.error != None:
+        drawSplash( surface, str( loader.error[1] ), splashOutputs )
+        pygame.time.wait( ERROR_DISPLAY_MS )
+        raise loader.error[0], loader.error[1], loader.error[2]
+
+    game = loader.game
+    if framebuffer != None:
+        game.outputs.append( framebuffer )
+    if args.export_raw != None:
+        game.outputs.append( RawOutput( args.export_raw ) )
+        print( "raw frames are {}x{}, {} bytes a pixel, "
+               "masks {:08x} {:08x} {:08x}".format(
+                    surface.get_width(),
+                    surface.get_height(),
+                    surface.get_bytesize(),
+                    *surface.get_masks()[:3] ) )
+    if args.export_png != None:
+        game.outputs.append( PNGOutput( args.export_png ) )
+    game.createButtons()
+    if args.record != None:
+        game.startRecording( args.record )
+    game.advance( args.advance )
+    if advanceTo != None:
+        game.advanceTo( advanceTo )
     game.start()
+    game.updateOutputs( game.drawBoard() )
+    print( "splash after {:.2f}s, board after {:.2f}s".format(
+        splashTime, time.time() - STARTED ) )
     game.runGame()
+    game.stopRecording()
+    game.closeOutputs()
+    game.profiler.close()
 
     pygame.quit()
 
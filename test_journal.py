@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+# Checks that a session recovered from its state and journal, as a power cut
+# would leave them, is the session that was running, including when the
+# event that fills the journal is followed at once by a snapshot, e.g.
+#
+#   python -m unittest discover
+
+import os, random, shutil, tempfile, unittest
+from simulation import Simulation, COMPACT_INTERVAL, columnsFromWagons
+
+
+EVENTS = 600
+
+LAYOUT = {
+    ".wtt": [   "+/6:05/am/Pick-up goods arrives from the junction",
+                "-/6:40/am/Pick-up goods departs for the junction",
+                "+/9:15/am/Coal train arrives",
+                "-/10:00/am/Coal empties depart",
+                "+/12:30/pm/Mixed goods arrives",
+                "-/1:10/pm/Mixed goods departs",
+                "+/4:45/pm/Evening goods arrives",
+                "-/5:30/pm/Evening goods departs" ],
+    ".layout": [    "4/0,1/20,20;300,20",
+                    "3/1,2/20,80;300,80",
+                    "5/0,2/780,40;480,40;460,60",
+                    "2//700,120;500,120" ],
+    ".config": [    "n/4",
+                    "w/Box van,1/Open wagon,1/Coal,1.5",
+                    "r/0/1/2/0",
+                    "r/2/2/1",
+                    "r/0/0",
+                    "i/0/1/2" ] }
+
+def sessionState( sim ):
+    # what a snapshot of the session holds, bar its generation
+    rakes = sim.rakes[ sim.nextRake: ] + sim.rakes[ :sim.nextRake ]
+    return (    sim.moveIndex,
+                [ siding.save().rows() for siding in sim.sidings ],
+                [ columnsFromWagons( rake ).rows() for rake in rakes ] )
+
+def changeWagon( sim, wagons, rng, remove ):
+    # changes the type of one of the wagons, given by rake and position. No
+    # siding would take a wagon of the blank type, so one that becomes it is
+    # either removed or changed again, back to the first type.
+    sim.selection = rng.choice( wagons )
+    sim.handleWagonChangeButton()
+    if sim.selectedWagon().wagonType == len( sim.wagonTypes ) - 1:
+        if remove:
+            sim.handleWagonSelectButton()
+        else:
+            sim.handleWagonChangeButton()
+    sim.selection = ()
+
+class JournalTest( unittest.TestCase ):
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp( prefix='stationmaster-test-' )
+        self.liveName = os.path.join( self.directory, "live" )
+        self.recoveredName = os.path.join( self.directory, "recovered" )
+        for (extension,lines) in LAYOUT.items():
+            for baseName in ( self.liveName, self.recoveredName ):
+                f = open( baseName + extension, "w" )
+                f.write( "\n".join( lines ) + "\n" )
+                f.close()
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory )
+
+    def recover( self ):
+        for extension in ( ".state", ".journal" ):
+            shutil.copy(    self.liveName + extension,
+                            self.recoveredName + extension )
+        recovered = Simulation( self.recoveredName )
+        recovered.openJournal()
+        recovered.closeJournal()
+        return recovered
+
+    def testRecoversEveryEvent( self ):
+        # a random run of moves and wagon changes, in which the event that
+        # fills each journal is made a change, a removal and a move in turn
+        rng = random.Random( 1 )
+        sim = Simulation( self.liveName, 1 )
+        sim.openJournal()
+        snapshots = { 'c': 0, 'd': 0, 'n': 0 }
+        kinds = 'cdn'
+        turn = 0
+        for event in xrange( EVENTS ):
+            # wagons one change from the blank type, and the others
+            lastType = len( sim.wagonTypes ) - 2
+            lastWagons = []
+            otherWagons = []
+            for idx in range( len( sim.rakes ) ):
+                for wagonIdx in range( len( sim.rakes[ idx ] ) ):
+                    if sim.rakes[ idx ][ wagonIdx ].wagonType == lastType:
+                        lastWagons.append( ( idx, wagonIdx ) )
+                    else:
+                        otherWagons.append( ( idx, wagonIdx ) )
+            wagons = lastWagons + otherWagons
+            entries = sim.journal.entries
+            kind = kinds[ turn ]
+            if kind == 'c' and entries == COMPACT_INTERVAL - 1 \
+               and len( wagons ) > 0:
+                changeWagon( sim, wagons, rng, False )
+            elif kind == 'd' and entries == COMPACT_INTERVAL - 2 \
+                 and len( lastWagons ) > 0:
+                # the change and then the removal, which fills the journal
+                changeWagon( sim, lastWagons, rng, True )
+            elif entries >= COMPACT_INTERVAL - 2 \
+                 or len( wagons ) == 0 \
+                 or rng.random() < 0.5:
+                sim.handleNextMoveButton()
+                kind = 'n'
+            else:
+                # wagons are only removed for the snapshots, so that the
+                # rakes are not emptied before one is due
+                changeWagon( sim, wagons, rng, False )
+            if sim.journal.entries < entries:
+                snapshots[ kind ] = snapshots[ kind ] + 1
+                if kind == kinds[ turn ]:
+                    turn = ( turn + 1 ) % len( kinds )
+            self.assertEqual(
+                sessionState( self.recover() ),
+                sessionState( sim ),
+                "event {}".format( event ) )
+        sim.closeJournal()
+        for kind in kinds:
+            self.assertTrue( snapshots[ kind ] > 0, kind )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+
+# Checks that OutgoingSelection chooses the same wagons as the list based
+# selection it replaced, including with wagon lengths that are not exact in
+# binary, e.g.
+#
+#   python -m unittest discover
+
+import random, unittest
+from simulation import OutgoingSelection, Wagon, WagonType
+
+
+CASES = 5000
+
+def listSelection( wagons, trainLength, wagonTypes ):
+    # the selection as it was: the lengths are summed afresh after each
+    # wagon is added, and the youngest, the first seen of equal ages, is
+    # dropped until they fit
+    def sumLengths( lhs, rhs ):
+        return lhs + rhs.length( wagonTypes )
+
+    def removeYoungest( oldest ):
+        youngest = oldest[0]
+        for candidate in oldest:
+            if candidate.age < youngest.age:
+                youngest = candidate
+        oldest.remove( youngest )
+
+    oldest = []
+    for wagon in wagons:
+        oldest.append( wagon )
+        while reduce( sumLengths, oldest, 0 ) > trainLength:
+            removeYoungest( oldest )
+    return oldest
+
+class OutgoingSelectionTest( unittest.TestCase ):
+    def compare( self, lengths, seed ):
+        rng = random.Random( seed )
+        wagonTypes = [  WagonType( str( idx ), length )
+                        for (idx,length) in enumerate( lengths ) ]
+        for case in xrange( CASES ):
+            trainLength = rng.randint( 1, 20 )
+            wagons = [  Wagon(  rng.randrange( len( wagonTypes ) ),
+                                rng.randint( 0, 30 ),
+                                False )
+                        for idx in xrange( rng.randint( 0, 40 ) ) ]
+            selection = OutgoingSelection( trainLength, wagonTypes )
+            for wagon in wagons:
+                selection.append( wagon )
+            chosen = set( map( id, selection.wagons() ) )
+            expected = set( map( id, listSelection(
+                                        wagons,
+                                        trainLength,
+                                        wagonTypes ) ) )
+            self.assertEqual(
+                [ idx for (idx,wagon) in enumerate( wagons )
+                  if id( wagon ) in chosen ],
+                [ idx for (idx,wagon) in enumerate( wagons )
+                  if id( wagon ) in expected ],
+                "case {}, train length {}".format( case, trainLength ) )
+
+    def testExactLengths( self ):
+        self.compare( [ 1, 1.5, 2, 0.5, 0.25, 3 ], 1 )
+
+    def testInexactLengths( self ):
+        self.compare( [ 1, 1.2, 0.8, 1.1 ], 2 )
+
+    def testTenths( self ):
+        self.compare( [ 0.1, 0.2, 0.3, 0.7 ], 3 )
+
+if __name__ == '__main__':
+    unittest.main()